@@ -1,35 +1,185 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, send_file, jsonify, make_response, abort, Response
+from flask import Flask, render_template, request, redirect, url_for, session, flash, send_file, jsonify, make_response, abort, Response, g, has_app_context, stream_with_context
 import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
 from werkzeug.security import generate_password_hash, check_password_hash
-from functools import wraps
+from functools import wraps, lru_cache
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 import os
 import pandas as pd
 import re, csv, io
+import tempfile
+import shutil
+import json
+import hashlib
+import uuid
+import threading
+import tracemalloc
+import multiprocessing
+import click
+import time as time_module
 from datetime import datetime, time, date
 from werkzeug.utils import secure_filename
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer,Image
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Flowable
+from reportlab.lib.utils import ImageReader
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from slugify import slugify
 from io import BytesIO
 from reportlab.lib.units import inch
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from xml.sax.saxutils import escape
 
 app = Flask(__name__)
 app.secret_key = 'app123'
 app.secret_key = os.urandom(24)
 
-conn = psycopg2.connect(
-    host="localhost",
-    database="attendance_db",
-    user="attendance_user",
-    password="uni@123"
+# ---------------- DATABASE CONNECTION POOL ----------------
+# One fixed-size pool per worker process. Each request checks out a single
+# connection on first use and hands it back on teardown.
+app.config['DB_DSN'] = os.environ.get(
+    'DATABASE_URL',
+    "host=localhost dbname=attendance_db user=attendance_user password=uni@123"
 )
+app.config['DB_POOL_MINCONN'] = int(os.environ.get('DB_POOL_MINCONN', 1))
+app.config['DB_POOL_MAXCONN'] = int(os.environ.get('DB_POOL_MAXCONN', 10))
+app.config['DB_POOL_TIMEOUT'] = float(os.environ.get('DB_POOL_TIMEOUT', 5))
+
+_db_pool = None
+_db_pool_pid = None
+_db_pool_slots = None
+_db_pool_lock = threading.Lock()
+_db_pool_stats = {
+    'checkouts': 0,
+    'waits': 0,
+    'timeouts': 0,
+    'in_use': 0,
+    'total_wait_ms': 0.0,
+    'max_wait_ms': 0.0,
+}
+
+
+def _get_db_pool():
+    """Create the pool lazily, and again after a fork (one pool per worker)."""
+    global _db_pool, _db_pool_pid, _db_pool_slots
+
+    if _db_pool is None or _db_pool_pid != os.getpid():
+        with _db_pool_lock:
+            if _db_pool is None or _db_pool_pid != os.getpid():
+                maxconn = app.config['DB_POOL_MAXCONN']
+                _db_pool = psycopg2.pool.ThreadedConnectionPool(
+                    app.config['DB_POOL_MINCONN'], maxconn, app.config['DB_DSN']
+                )
+                _db_pool_slots = threading.BoundedSemaphore(maxconn)
+                _db_pool_pid = os.getpid()
+                _db_pool_stats['in_use'] = 0
+    return _db_pool
+
+
+class PooledConnection:
+    """Thin wrapper around a pooled psycopg2 connection.
+
+    Routes keep calling conn.close() as before; inside a request that is a
+    no-op and the connection goes back to the pool on teardown. Outside a
+    request (CLI commands, scripts) close() returns it to the pool directly.
+    """
+
+    def __init__(self, raw, request_scoped):
+        self._raw = raw
+        self._request_scoped = request_scoped
+        self._released = False
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def close(self):
+        if not self._request_scoped:
+            self.release()
+
+    def release(self):
+        if self._released:
+            return
+        self._released = True
+
+        pool = _get_db_pool()
+        broken = bool(self._raw.closed)
+        if not broken:
+            try:
+                if self._raw.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    self._raw.rollback()
+            except psycopg2.Error:
+                broken = True
+
+        pool.putconn(self._raw, close=broken)
+        _db_pool_slots.release()
+        with _db_pool_lock:
+            _db_pool_stats['in_use'] -= 1
+
+
+def _checkout_connection(request_scoped):
+    pool = _get_db_pool()
+    timeout = app.config['DB_POOL_TIMEOUT']
+
+    started = time_module.monotonic()
+    waited = not _db_pool_slots.acquire(blocking=False)
+    if waited and not _db_pool_slots.acquire(timeout=timeout):
+        with _db_pool_lock:
+            _db_pool_stats['timeouts'] += 1
+        raise psycopg2.pool.PoolError(
+            f"No database connection available after {timeout:g}s"
+        )
+    wait_ms = (time_module.monotonic() - started) * 1000
+
+    try:
+        raw = pool.getconn()
+    except Exception:
+        _db_pool_slots.release()
+        raise
+
+    with _db_pool_lock:
+        _db_pool_stats['checkouts'] += 1
+        _db_pool_stats['in_use'] += 1
+        if waited:
+            _db_pool_stats['waits'] += 1
+            _db_pool_stats['total_wait_ms'] += wait_ms
+            _db_pool_stats['max_wait_ms'] = max(_db_pool_stats['max_wait_ms'], wait_ms)
+
+    return PooledConnection(raw, request_scoped)
+
 
 def get_db_connection():
-    return psycopg2.connect(
-        "host=localhost dbname=attendance_db user=attendance_user password=uni@123"
-    )
+    """Return this request's pooled connection, checking one out on first use."""
+    if not has_app_context():
+        return _checkout_connection(request_scoped=False)
+
+    if 'db_conn' not in g:
+        g.db_conn = _checkout_connection(request_scoped=True)
+    return g.db_conn
+
+
+@app.teardown_appcontext
+def release_db_connection(exc):
+    conn = g.pop('db_conn', None)
+    if conn is not None:
+        conn.release()
+
+
+def db_pool_stats():
+    with _db_pool_lock:
+        stats = dict(_db_pool_stats)
+    stats['minconn'] = app.config['DB_POOL_MINCONN']
+    stats['maxconn'] = app.config['DB_POOL_MAXCONN']
+    stats['timeout_s'] = app.config['DB_POOL_TIMEOUT']
+    stats['avg_wait_ms'] = round(stats['total_wait_ms'] / stats['waits'], 2) if stats['waits'] else 0.0
+    return stats
+
+
+@app.errorhandler(psycopg2.pool.PoolError)
+def handle_pool_exhausted(e):
+    app.logger.warning("DB pool exhausted: %s (stats=%s)", e, db_pool_stats())
+    return "The server is busy, please try again in a moment.", 503
 
 def init_db():
     conn = get_db_connection()
@@ -169,17 +319,1666 @@ def init_db():
             FOREIGN KEY (semester_id) REFERENCES semesters(id)
         )
     ''')
-    
+
+    conn.commit()
+
+    applied = run_migrations(conn)
+    conn.close()
+    return applied
+
+
+# ---------------- ATTENDANCE PARTITIONS ----------------
+# attendance is list-partitioned by batch_id, and each batch's partition by
+# semester_id (attendance_b<batch>_s<semester>), so a query that names a
+# batch and semester only touches that cohort's semester. Each batch's
+# default partition catches rows for semesters that have no partition yet;
+# ensure_attendance_partitions moves them out when it creates one.
+#
+# attendance itself has no default partition, so a purged batch's
+# partition can be detached CONCURRENTLY without locking out attendance
+# reads and writes. Every batch therefore needs its partition before
+# attendance is marked for it: manage_batches creates it, and
+# 'flask attendance-partitions' fills in any that are missing.
+
+def _partition_attendance(cursor):
+    cursor.execute('ALTER TABLE attendance RENAME TO attendance_unpartitioned')
+    cursor.execute('ALTER SEQUENCE attendance_id_seq OWNED BY NONE')
+    cursor.execute('''
+        CREATE TABLE attendance (
+            id INTEGER NOT NULL DEFAULT nextval('attendance_id_seq'),
+            student_id TEXT NOT NULL REFERENCES users(id),
+            course_id INTEGER NOT NULL REFERENCES courses(id),
+            batch_id INTEGER NOT NULL REFERENCES batches(id),
+            department_id INTEGER NOT NULL REFERENCES departments(id),
+            semester_id INTEGER NOT NULL REFERENCES semesters(id),
+            section_id INTEGER REFERENCES sections(id),
+            date DATE NOT NULL,
+            start_time TIME NOT NULL,
+            end_time TIME NOT NULL,
+            status attendance_status NOT NULL,
+            class_type class_kind NOT NULL,
+            PRIMARY KEY (id, batch_id, semester_id)
+        ) PARTITION BY LIST (batch_id)
+    ''')
+    cursor.execute('ALTER SEQUENCE attendance_id_seq OWNED BY attendance.id')
+
+    # Every existing row's batch (a foreign key) gets its partition here.
+    cursor.execute('SELECT id FROM batches ORDER BY id')
+    for (batch_id,) in cursor.fetchall():
+        ensure_attendance_partitions(cursor, batch_id)
+
+    cursor.execute('''
+        INSERT INTO attendance
+        (id, student_id, course_id, batch_id, department_id, semester_id,
+         section_id, date, start_time, end_time, status, class_type)
+        SELECT id, student_id, course_id, batch_id, department_id, semester_id,
+               section_id, date, start_time, end_time, status, class_type
+        FROM attendance_unpartitioned
+    ''')
+    cursor.execute('DROP TABLE attendance_unpartitioned')
+
+    # The old table's indexes went with it; these cascade to every partition.
+    for sql in (
+        'CREATE INDEX idx_attendance_course_student ON attendance (course_id, student_id)',
+        'CREATE INDEX idx_attendance_student ON attendance (student_id)',
+        '''CREATE INDEX idx_attendance_class_slot
+           ON attendance (batch_id, department_id, semester_id, course_id, date, start_time)''',
+        '''CREATE INDEX idx_attendance_course_page
+           ON attendance (course_id, date DESC, student_id, id)''',
+        'CREATE INDEX idx_attendance_department ON attendance (department_id)',
+    ):
+        cursor.execute(sql)
+
+
+def attendance_is_partitioned(cursor):
+    cursor.execute('''
+        SELECT EXISTS (
+            SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'attendance'::regclass
+        )
+    ''')
+    return cursor.fetchone()[0]
+
+
+def _table_exists(cursor, name):
+    cursor.execute('SELECT to_regclass(%s) IS NOT NULL', (name,))
+    return cursor.fetchone()[0]
+
+
+def _create_partition(cursor, default_table, key_column, key, *create_sql):
+    """Run the create_sql statements, first moving rows for key out of default_table."""
+    if not _table_exists(cursor, default_table):
+        for sql in create_sql:
+            cursor.execute(sql)
+        return
+
+    cursor.execute(f'SELECT EXISTS (SELECT 1 FROM {default_table} WHERE {key_column} = %s)', (key,))
+    if not cursor.fetchone()[0]:
+        for sql in create_sql:
+            cursor.execute(sql)
+        return
+
+    cursor.execute('CREATE TEMP TABLE attendance_moving (LIKE attendance)')
+    cursor.execute(f'''
+        WITH moved AS (
+            DELETE FROM {default_table} WHERE {key_column} = %s RETURNING *
+        )
+        INSERT INTO attendance_moving SELECT * FROM moved
+    ''', (key,))
+    for sql in create_sql:
+        cursor.execute(sql)
+    cursor.execute('INSERT INTO attendance SELECT * FROM attendance_moving')
+    cursor.execute('DROP TABLE attendance_moving')
+
+
+def ensure_attendance_partitions(cursor, batch_id):
+    """Create any missing partitions for a batch. Returns their names.
+
+    Does nothing until migration 9 has partitioned attendance.
+    """
+    if not attendance_is_partitioned(cursor):
+        return []
+
+    batch_id = int(batch_id)
+    batch_table = f'attendance_b{batch_id}'
+    created = []
+
+    if not _table_exists(cursor, batch_table):
+        cursor.execute(f'''
+            CREATE TABLE {batch_table} PARTITION OF attendance
+            FOR VALUES IN ({batch_id}) PARTITION BY LIST (semester_id)
+        ''')
+        cursor.execute(f'CREATE TABLE {batch_table}_default PARTITION OF {batch_table} DEFAULT')
+        created.append(batch_table)
+
+    cursor.execute('SELECT id FROM semesters ORDER BY id')
+    for (semester_id,) in cursor.fetchall():
+        name = f'{batch_table}_s{semester_id}'
+        if _table_exists(cursor, name):
+            continue
+        _create_partition(cursor, f'{batch_table}_default', 'semester_id', semester_id, f'''
+            CREATE TABLE {name} PARTITION OF {batch_table}
+            FOR VALUES IN ({semester_id})
+        ''')
+        created.append(name)
+
+    return created
+
+
+def batch_partition_exists(cursor, batch_id):
+    """Whether attendance can take rows for this batch."""
+    return _table_exists(cursor, f'attendance_b{int(batch_id)}')
+
+
+def drop_batch_partition(conn, batch_id):
+    """Detach a batch's attendance partition CONCURRENTLY, then drop it.
+
+    A plain DROP of a partition locks all of attendance. Detaching
+    concurrently only waits for queries already running; it has to run
+    outside a transaction, so this commits whatever the caller had open.
+    """
+    name = f'attendance_b{int(batch_id)}'
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT inhdetachpending FROM pg_inherits
+        WHERE inhrelid = to_regclass(%s) AND inhparent = 'attendance'::regclass
+    ''', (name,))
+    row = cursor.fetchone()
+    conn.commit()
+
+    if row is not None:
+        # FINALIZE completes a concurrent detach that was interrupted.
+        mode = 'FINALIZE' if row[0] else 'CONCURRENTLY'
+        conn.set_session(autocommit=True)
+        try:
+            cursor.execute(f'ALTER TABLE attendance DETACH PARTITION {name} {mode}')
+        finally:
+            conn.set_session(autocommit=False)
+
+    cursor.execute(f'DROP TABLE IF EXISTS {name}')
+    conn.commit()
+    cursor.close()
+
+
+def _parse_batch_semester(value):
+    try:
+        batch_id, semester_id = (int(part) for part in value.split(':'))
+    except ValueError:
+        raise click.BadParameter(f'expected BATCH:SEMESTER, got {value!r}')
+    return batch_id, semester_id
+
+
+@app.cli.command('attendance-partitions')
+@click.option('--detach', multiple=True, metavar='BATCH:SEMESTER',
+              help="Detach a finished semester's partition (repeatable).")
+@click.option('--attach', multiple=True, metavar='BATCH:SEMESTER',
+              help='Re-attach a previously detached partition (repeatable).')
+def attendance_partitions_command(detach, attach):
+    """Create missing attendance partitions, then detach/attach semesters.
+
+    A detached partition stays as a plain table of the same name. Live
+    queries stop reading it, but attendance_summary still counts its rows,
+    so the percentage reports are unchanged.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        if not attendance_is_partitioned(cursor):
+            raise click.ClickException('attendance is not partitioned yet; run flask migrate.')
+
+        cursor.execute('SELECT id FROM batches WHERE deleted_at IS NULL ORDER BY id')
+        for (batch_id,) in cursor.fetchall():
+            for name in ensure_attendance_partitions(cursor, batch_id):
+                click.echo(f'created {name}')
+
+        for value in detach:
+            batch_id, semester_id = _parse_batch_semester(value)
+            cursor.execute(
+                f'ALTER TABLE attendance_b{batch_id} DETACH PARTITION attendance_b{batch_id}_s{semester_id}'
+            )
+            click.echo(f'detached attendance_b{batch_id}_s{semester_id}')
+
+        for value in attach:
+            batch_id, semester_id = _parse_batch_semester(value)
+            cursor.execute(f'''
+                ALTER TABLE attendance_b{batch_id}
+                ATTACH PARTITION attendance_b{batch_id}_s{semester_id} FOR VALUES IN ({semester_id})
+            ''')
+            click.echo(f'attached attendance_b{batch_id}_s{semester_id}')
+
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def _create_cache_sequences(cursor):
+    # One per VersionedCache; see IN-PROCESS CACHES.
+    for name in _caches:
+        cursor.execute(f'CREATE SEQUENCE IF NOT EXISTS {CACHE_SEQUENCE_PREFIX}{name}')
+
+
+# ---------------- SCHEMA MIGRATIONS ----------------
+# Each entry is (version, description, steps). A step is either a SQL string
+# or a callable taking the cursor. Versions are applied once, in order, each
+# in its own transaction, and recorded in schema_migrations.
+MIGRATIONS = [
+    (1, 'attendance and timetable lookup indexes', [
+        # view_attendance, teacher_generate_reports, delete_course
+        'CREATE INDEX IF NOT EXISTS idx_attendance_course_student ON attendance (course_id, student_id)',
+        # delete_student, admin_generate_reports join from users
+        'CREATE INDEX IF NOT EXISTS idx_attendance_student ON attendance (student_id)',
+        # mark_attendance duplicate check
+        '''CREATE INDEX IF NOT EXISTS idx_attendance_class_slot
+           ON attendance (batch_id, department_id, semester_id, course_id, date, start_time)''',
+        # manage_attendance (ORDER BY a.date DESC)
+        'CREATE INDEX IF NOT EXISTS idx_attendance_course_date ON attendance (course_id, date DESC)',
+        # timetable_lookup, mark_attendance practical slots, timetable grids
+        '''CREATE INDEX IF NOT EXISTS idx_timetable_section_day
+           ON timetable (batch_id, department_id, semester_id, section_id, day)''',
+        '''CREATE INDEX IF NOT EXISTS idx_timetable_no_section_day
+           ON timetable (batch_id, department_id, semester_id, day)
+           WHERE section_id IS NULL''',
+        'CREATE INDEX IF NOT EXISTS idx_timetable_course ON timetable (course_id)',
+    ]),
+    (2, 'roster, course and allocation indexes', [
+        # view_students, mark_attendance roster, reports
+        'CREATE INDEX IF NOT EXISTS idx_users_roster ON users (role, batch_id, department_id, section_id)',
+        '''CREATE INDEX IF NOT EXISTS idx_users_roster_no_section
+           ON users (role, batch_id, department_id)
+           WHERE section_id IS NULL''',
+        '''CREATE INDEX IF NOT EXISTS idx_courses_scope
+           ON courses (batch_id, department_id, semester_id, section_id)''',
+        '''CREATE INDEX IF NOT EXISTS idx_courses_scope_no_section
+           ON courses (batch_id, department_id, semester_id)
+           WHERE section_id IS NULL''',
+        '''CREATE INDEX IF NOT EXISTS idx_course_allocations_teacher
+           ON course_allocations (teacher_id, batch_id, department_id, semester_id, section_id)''',
+        'CREATE INDEX IF NOT EXISTS idx_course_allocations_course ON course_allocations (course_id)',
+        'CREATE INDEX IF NOT EXISTS idx_sections_batch_department ON sections (batch_id, department_id)',
+    ]),
+    (3, 'typed attendance columns', [
+        # update_attendance used to store 'Present'/'Absent'; normalise to the
+        # lowercase values mark_attendance and the reports use.
+        "CREATE TYPE attendance_status AS ENUM ('present', 'absent')",
+        "CREATE TYPE class_kind AS ENUM ('Theory', 'Practical')",
+        '''ALTER TABLE attendance
+           ALTER COLUMN date TYPE DATE USING date::date,
+           ALTER COLUMN start_time TYPE TIME USING start_time::time,
+           ALTER COLUMN end_time TYPE TIME USING end_time::time,
+           ALTER COLUMN status TYPE attendance_status
+               USING LOWER(TRIM(status))::attendance_status,
+           ALTER COLUMN class_type TYPE class_kind
+               USING INITCAP(TRIM(class_type))::class_kind''',
+    ]),
+    (4, 'per-student, per-course attendance summary', [
+        '''CREATE TABLE attendance_summary (
+               student_id TEXT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+               course_id INTEGER NOT NULL REFERENCES courses(id) ON DELETE CASCADE,
+               total_count INTEGER NOT NULL DEFAULT 0,
+               present_count INTEGER NOT NULL DEFAULT 0,
+               PRIMARY KEY (student_id, course_id)
+           )''',
+        '''INSERT INTO attendance_summary (student_id, course_id, total_count, present_count)
+           SELECT student_id, course_id, COUNT(*), COUNT(*) FILTER (WHERE status = 'present')
+           FROM attendance
+           GROUP BY student_id, course_id''',
+        'CREATE INDEX IF NOT EXISTS idx_attendance_summary_course ON attendance_summary (course_id)',
+    ]),
+    (5, 'manage_attendance keyset paging and trigram search', [
+        # Seek pagination: ORDER BY a.date DESC, a.student_id, a.id
+        '''CREATE INDEX IF NOT EXISTS idx_attendance_course_page
+           ON attendance (course_id, date DESC, student_id, id)''',
+        'DROP INDEX IF EXISTS idx_attendance_course_date',
+        # ILIKE '%x%' on student id / name
+        'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+        'CREATE INDEX IF NOT EXISTS idx_users_id_trgm ON users USING gin (id gin_trgm_ops)',
+        'CREATE INDEX IF NOT EXISTS idx_users_name_trgm ON users USING gin (name gin_trgm_ops)',
+    ]),
+    (6, 'stored natural-sort key for student ids', [
+        # Trailing digits of the id ('BBSUTSD-0042' -> 42), so rosters sort
+        # 2 before 10. At most 18 digits so the cast can never overflow.
+        '''ALTER TABLE users ADD COLUMN id_sort_key BIGINT
+           GENERATED ALWAYS AS (CAST(SUBSTRING(id FROM '(\\d{1,18})$') AS BIGINT)) STORED''',
+        '''CREATE INDEX IF NOT EXISTS idx_users_roster_sorted
+           ON users (role, batch_id, department_id, section_id, id_sort_key, id)''',
+        '''CREATE INDEX IF NOT EXISTS idx_users_roster_batch_sorted
+           ON users (role, batch_id, department_id, id_sort_key, id)''',
+        'DROP INDEX IF EXISTS idx_users_roster',
+        'DROP INDEX IF EXISTS idx_users_roster_no_section',
+    ]),
+    (7, 'case-insensitive email lookup for login', [
+        'CREATE INDEX IF NOT EXISTS idx_users_email_lower ON users (LOWER(email))',
+    ]),
+    (8, 'deferred batch and department deletes', [
+        'ALTER TABLE batches ADD COLUMN deleted_at TIMESTAMPTZ',
+        'ALTER TABLE departments ADD COLUMN deleted_at TIMESTAMPTZ',
+        '''CREATE TABLE purge_jobs (
+               id SERIAL PRIMARY KEY,
+               kind TEXT NOT NULL CHECK (kind IN ('batch', 'department')),
+               target_id INTEGER NOT NULL,
+               requested_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+               finished_at TIMESTAMPTZ,
+               error TEXT
+           )''',
+        # Chunked purges look attendance up by batch/department directly.
+        'CREATE INDEX IF NOT EXISTS idx_attendance_department ON attendance (department_id)',
+    ]),
+    (9, 'partition attendance by batch and semester', [
+        _partition_attendance,
+    ]),
+    (10, 'cache version sequences shared by all workers', [
+        _create_cache_sequences,
+    ]),
+    (11, 'normalised timetable day names', [
+        # Lookups compare day = 'Monday' so they can use the day index; older
+        # rows may carry stray whitespace or other casing.
+        "UPDATE timetable SET day = INITCAP(TRIM(day)) WHERE day <> INITCAP(TRIM(day))",
+        'ALTER TABLE timetable ADD CONSTRAINT timetable_day_normalised CHECK (day = INITCAP(TRIM(day)))',
+    ]),
+]
+
+# Arbitrary key so concurrent workers don't run the same migration twice.
+MIGRATION_LOCK_KEY = 727100
+
+
+def run_migrations(conn):
+    """Apply pending MIGRATIONS and return the versions applied now."""
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TIMESTAMP NOT NULL DEFAULT NOW()
+        )
+    ''')
+    conn.commit()
+
+    cursor.execute('SELECT pg_advisory_lock(%s)', (MIGRATION_LOCK_KEY,))
+    applied_now = []
+    try:
+        cursor.execute('SELECT version FROM schema_migrations')
+        applied = {r[0] for r in cursor.fetchall()}
+
+        for version, description, steps in sorted(MIGRATIONS, key=lambda m: m[0]):
+            if version in applied:
+                continue
+            try:
+                for step in steps:
+                    if callable(step):
+                        step(cursor)
+                    else:
+                        cursor.execute(step)
+                cursor.execute(
+                    'INSERT INTO schema_migrations (version, description) VALUES (%s, %s)',
+                    (version, description)
+                )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            applied_now.append(version)
+    finally:
+        cursor.execute('SELECT pg_advisory_unlock(%s)', (MIGRATION_LOCK_KEY,))
+        conn.commit()
+
+    return applied_now
+
+
+@app.cli.command('migrate')
+def migrate_command():
+    """Create missing tables and apply pending schema migrations."""
+    applied = init_db()
+    if applied:
+        click.echo(f"Applied migrations: {', '.join(str(v) for v in applied)}")
+    else:
+        click.echo("Schema is up to date.")
+
+
+# ---------------- ACCESS CONTROL ----------------
+def role_required(*roles):
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            # Check login first
+            if not session.get('logged_in'):
+                flash('You must log in first.', 'warning')
+                return redirect(url_for('login'))
+
+            current_role = session.get('role')
+
+            # Check if user's role is allowed
+            if current_role not in [r.lower() for r in roles]:
+                flash('Access Denied! Please use your own dashboard.', 'warning')
+                return redirect(url_for(f"{current_role}_dashboard"))
+
+            return f(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# ---------------- IN-PROCESS CACHES ----------------
+# Each worker process keeps its own copy. Every cache also has a sequence in
+# the database, cache_version_<name>, that invalidate() bumps; workers poll
+# the sequences at most every CACHE_SYNC_INTERVAL seconds and drop a cache
+# whose sequence moved, so a change made in one worker reaches the others
+# within that interval. Sequences are used because nextval() is not undone
+# by a rollback and takes no row locks. A new cache needs its sequence
+# created by a migration (_create_cache_sequences).
+app.config['CACHE_TTL'] = int(os.environ.get('CACHE_TTL', 300))
+app.config['CACHE_SYNC_INTERVAL'] = float(os.environ.get('CACHE_SYNC_INTERVAL', 2))
+CACHE_SEQUENCE_PREFIX = 'cache_version_'
+
+_caches = {}
+_cache_versions_seen = {}
+_cache_synced_at = None
+_cache_sync_lock = threading.Lock()
+
+
+def _publish_cache_invalidation(name):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT nextval(%s)', (CACHE_SEQUENCE_PREFIX + name,))
+    version = cursor.fetchone()[0]
+    cursor.close()
+    conn.close()
+
+    with _cache_sync_lock:
+        # Nobody else bumped it since we last looked: no need to drop our
+        # own cache again on the next sync.
+        if _cache_versions_seen.get(name) == version - 1:
+            _cache_versions_seen[name] = version
+
+
+def _sync_caches():
+    """Drop every cache another worker has invalidated since the last check."""
+    global _cache_synced_at
+    now = time_module.monotonic()
+    with _cache_sync_lock:
+        if _cache_synced_at is not None and now - _cache_synced_at < app.config['CACHE_SYNC_INTERVAL']:
+            return
+        _cache_synced_at = now
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT sequencename, COALESCE(last_value, 0)
+        FROM pg_sequences
+        WHERE schemaname = current_schema()
+          AND starts_with(sequencename, %s)
+    ''', (CACHE_SEQUENCE_PREFIX,))
+    rows = cursor.fetchall()
+    cursor.close()
+    conn.close()
+
+    stale = []
+    with _cache_sync_lock:
+        for sequence, version in rows:
+            name = sequence[len(CACHE_SEQUENCE_PREFIX):]
+            seen = _cache_versions_seen.get(name)
+            _cache_versions_seen[name] = version
+            if seen is not None and seen != version and name in _caches:
+                stale.append(_caches[name])
+    for cache in stale:
+        cache.clear()
+
+
+class VersionedCache:
+    """Small per-process cache with explicit invalidation.
+
+    invalidate() bumps a version, so a value loaded before the bump is never
+    stored or served after it, and publishes the bump to the other workers,
+    which drop the whole cache within CACHE_SYNC_INTERVAL seconds. Entries
+    also expire after CACHE_TTL seconds.
+
+    group, if given, maps a key to the group it belongs to (say, the student
+    of a (student, semester) key), so invalidate_groups() can drop every key
+    of a group without listing them.
+    """
+
+    def __init__(self, name, maxsize=None, group=None):
+        self.name = name
+        self.maxsize = maxsize
+        self.group = group
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self._key_versions = {}
+        self._group_versions = {}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        _caches[name] = self
+
+    def _stamp(self, key):
+        group_version = self._group_versions.get(self.group(key), 0) if self.group else 0
+        return (self.version, self._key_versions.get(key, 0), group_version)
+
+    def get(self, key, loader):
+        _sync_caches()
+        now = time_module.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            stamp = self._stamp(key)
+            if entry and entry[0] == stamp and now - entry[1] < app.config['CACHE_TTL']:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+
+        value = loader()
+
+        with self._lock:
+            if self._stamp(key) == stamp:
+                self._entries[key] = (stamp, now, value)
+                self._entries.move_to_end(key)
+                if self.maxsize and len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self, key=None):
+        """Drop one key, or everything when key is None, in every worker."""
+        with self._lock:
+            if key is None:
+                self.version += 1
+                self._entries.clear()
+            else:
+                self._key_versions[key] = self._key_versions.get(key, 0) + 1
+                self._entries.pop(key, None)
+        _publish_cache_invalidation(self.name)
+
+    def invalidate_groups(self, groups):
+        """Drop every key of these groups, in every worker, with one publish."""
+        groups = set(groups)
+        if not groups:
+            return
+        with self._lock:
+            for group in groups:
+                self._group_versions[group] = self._group_versions.get(group, 0) + 1
+            for key in [k for k in self._entries if self.group(k) in groups]:
+                del self._entries[key]
+        _publish_cache_invalidation(self.name)
+
+    def clear(self):
+        """Drop everything in this worker only."""
+        with self._lock:
+            self.version += 1
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'version': self.version, 'entries': len(self._entries),
+                    'hits': self.hits, 'misses': self.misses}
+
+
+def _as_id(value):
+    """Form/query-string ids arrive as strings; cache keys are ints."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+# ---------------- DATE/TIME FORMATTING ----------------
+# Every page, filter and export formats times and dates through these. A
+# timetable or attendance listing only ever has a few distinct slot times
+# and dates, so results are memoized in small bounded LRU caches.
+FORMAT_CACHE_SIZE = 4096
+TIME_FORMAT = '%I:%M %p'
+DATE_FORMAT = '%d-%m-%Y'
+
+
+@lru_cache(maxsize=FORMAT_CACHE_SIZE)
+def format_time(value):
+    """A TIME value or 'HH:MM[:SS]' string as '09:30 AM'.
+
+    Empty values give ''; anything unparseable is returned unchanged.
+    """
+    if not value:
+        return ''
+    if isinstance(value, str):
+        try:
+            value = time.fromisoformat(value.strip())
+        except ValueError:
+            return value
+    if isinstance(value, (time, datetime)):
+        return value.strftime(TIME_FORMAT)
+    return value
+
+
+@lru_cache(maxsize=FORMAT_CACHE_SIZE)
+def format_date(value):
+    """A DATE value or 'YYYY-MM-DD' string as '31-12-2025'."""
+    if not value:
+        return ''
+    if isinstance(value, str):
+        try:
+            value = date.fromisoformat(value.strip())
+        except ValueError:
+            return value
+    if isinstance(value, date):
+        return value.strftime(DATE_FORMAT)
+    return value
+
+
+app.add_template_filter(format_time)
+app.add_template_filter(format_date)
+# Older templates use this name.
+app.add_template_filter(format_time, 'convert_to_12h')
+
+
+@app.cli.command('bench-formatting')
+@click.option('--cells', default=100000, show_default=True,
+              help='Times and dates to format per run.')
+def bench_formatting_command(cells):
+    """Time per-cell strptime/strftime against the memoized formatters."""
+    slots = ['08:30', '09:30:00', '10:30', '11:30:00', '13:30', '14:30:00', '15:30']
+    times = [t for s in slots for t in (s, time.fromisoformat(s))]
+    first_day = date(2025, 1, 1).toordinal()
+    days = [date.fromordinal(first_day + i) for i in range(120)]
+    workload = [(times[i % len(times)], days[i % len(days)]) for i in range(cells)]
+
+    def legacy_time(t):
+        if isinstance(t, str):
+            return datetime.strptime(t[:5], '%H:%M').strftime(TIME_FORMAT)
+        return t.strftime(TIME_FORMAT)
+
+    def run(fmt_time, fmt_date):
+        started = time_module.perf_counter()
+        for t, d in workload:
+            fmt_time(t)
+            fmt_date(d)
+        return time_module.perf_counter() - started
+
+    legacy = run(legacy_time, lambda d: d.strftime(DATE_FORMAT))
+    format_time.cache_clear()
+    format_date.cache_clear()
+    cold = run(format_time, format_date)
+    warm = run(format_time, format_date)
+
+    for label, elapsed in (('per-cell strptime/strftime', legacy),
+                           ('memoized, cold cache', cold),
+                           ('memoized, warm cache', warm)):
+        click.echo(f"{label:<28} {elapsed * 1000:9.1f} ms  {elapsed * 1e9 / cells / 2:8.0f} ns/value")
+    click.echo(f"cache: {format_time.cache_info()}")
+
+
+# ---------------- REFERENCE DATA ----------------
+# Batches, departments, semesters and sections change a few times a year but
+# fill dropdowns on almost every page. manage_batches, manage_departments and
+# manage_sections call invalidate_reference_data() after writing.
+reference_cache = VersionedCache('reference')
+
+
+def _load_reference_data():
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    data = {}
+    for table in ('batches', 'departments', 'semesters'):
+        # Deleted batches/departments stay hidden while their purge runs.
+        live = 'WHERE deleted_at IS NULL' if table != 'semesters' else ''
+        cursor.execute(f'SELECT id, name FROM {table} {live} ORDER BY name')
+        by_name = cursor.fetchall()
+        data[table] = {
+            'name': by_name,
+            'id': sorted(by_name, key=lambda r: r[0]),
+            'names': {r[0]: r[1] for r in by_name},
+        }
+
+    cursor.execute('SELECT id, name, batch_id, department_id FROM sections ORDER BY name')
+    sections = cursor.fetchall()
+    by_scope = {}
+    for section_id, name, batch_id, department_id in sections:
+        by_scope.setdefault((batch_id, department_id), []).append((section_id, name))
+    data['sections'] = {
+        'by_scope': by_scope,
+        'names': {r[0]: r[1] for r in sections},
+    }
+
+    cursor.close()
+    conn.close()
+    return data
+
+
+def reference_data():
+    return reference_cache.get('all', _load_reference_data)
+
+
+def invalidate_reference_data():
+    reference_cache.invalidate()
+    dropdown_cache.invalidate()
+
+
+def reference_rows(table, order_by='name'):
+    """(id, name) rows of batches, departments or semesters for a dropdown."""
+    return reference_data()[table][order_by]
+
+
+def reference_name(table, item_id):
+    """Name of a batch/department/semester/section by id, or None."""
+    return reference_data()[table]['names'].get(_as_id(item_id))
+
+
+def sections_for(batch_id, department_id):
+    """(id, name) sections of a batch + department, ordered by name."""
+    key = (_as_id(batch_id), _as_id(department_id))
+    return reference_data()['sections']['by_scope'].get(key, [])
+
+
+# ---------------- DROPDOWN TREE ----------------
+# Everything the cascading batch -> department -> section -> semester ->
+# course dropdowns need, sent once per page instead of one request per
+# change. Teachers only see the batches, departments, semesters and courses
+# allocated to them; sections are the full list, as check_sections returned.
+dropdown_cache = VersionedCache('dropdowns', maxsize=512)
+
+
+def _load_dropdown_tree(teacher_id):
+    data = reference_data()
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    if teacher_id is None:
+        cursor.execute('''
+            SELECT batch_id, department_id, semester_id, section_id, id, name
+            FROM courses
+            ORDER BY name
+        ''')
+    else:
+        cursor.execute('''
+            SELECT DISTINCT ca.batch_id, ca.department_id, ca.semester_id, ca.section_id, c.id, c.name
+            FROM course_allocations ca
+            JOIN courses c ON c.id = ca.course_id
+            WHERE ca.teacher_id = %s
+            ORDER BY c.name
+        ''', (teacher_id,))
+    rows = cursor.fetchall()
+    cursor.close()
+    conn.close()
+
+    courses = {}
+    for batch_id, department_id, semester_id, section_id, course_id, name in rows:
+        key = f"{batch_id}-{department_id}-{semester_id}-{section_id or ''}"
+        courses.setdefault(key, []).append({'id': course_id, 'name': name})
+
+    batches = data['batches']['name']
+    departments = data['departments']['name']
+    semesters = data['semesters']['id']
+    scopes = data['sections']['by_scope'].keys()
+
+    if teacher_id is not None:
+        batches = [r for r in batches if r[0] in {row[0] for row in rows}]
+        departments = [r for r in departments if r[0] in {row[1] for row in rows}]
+        semesters = [r for r in semesters if r[0] in {row[2] for row in rows}]
+
+    tree = {
+        'batches': batches,
+        'departments': departments,
+        'semesters': semesters,
+        'sections': {
+            f'{batch_id}-{department_id}': sections_for(batch_id, department_id)
+            for batch_id, department_id in scopes
+        },
+        'courses': courses,
+    }
+    body = json.dumps(tree, separators=(',', ':'))
+    return body, hashlib.sha256(body.encode('utf-8')).hexdigest()[:32]
+
+
+def invalidate_dropdowns():
+    dropdown_cache.invalidate()
+
+
+@app.route('/api/dropdown_tree')
+@role_required('admin', 'teacher')
+def dropdown_tree():
+    """Dropdown data for the current user (see static/js/dropdown_tree.js).
+
+    Sections are keyed "batch-department" and courses
+    "batch-department-semester-section" (section empty when there is none).
+    """
+    teacher_id = session['user_id'] if session['role'] == 'teacher' else None
+    key = ('teacher', teacher_id) if teacher_id else 'admin'
+    body, etag = dropdown_cache.get(key, lambda: _load_dropdown_tree(teacher_id))
+
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    # Cached by the browser, but revalidated on every page load.
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.vary.add('Cookie')
+    return response.make_conditional(request)
+
+
+# ---------------- TIMETABLE GRID ----------------
+# The day x time-slot grid of one batch/department/semester/section, shared
+# by the admin timetable page, the student/teacher view and the timetable
+# PDF. Timetable, allocation, course and teacher changes invalidate it.
+# Passing TIMETABLE_ALL_SECTIONS as the section gives every section's entries
+# in one grid, each course labelled with its section, as the PDF download has
+# always done when no section is chosen.
+TIMETABLE_DAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']
+TIMETABLE_ALL_SECTIONS = 'all'
+timetable_cache = VersionedCache('timetable', maxsize=1024)
+
+
+def _timetable_key(batch_id, department_id, semester_id, section_id=None):
+    if section_id != TIMETABLE_ALL_SECTIONS:
+        section_id = _as_id(section_id)
+    return (_as_id(batch_id), _as_id(department_id), _as_id(semester_id), section_id)
+
+
+def _load_timetable_grid(batch_id, department_id, semester_id, section_id):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    all_sections = section_id == TIMETABLE_ALL_SECTIONS
+    params = [batch_id, department_id, semester_id]
+    if all_sections:
+        section_filter = ""
+    elif section_id:
+        section_filter = "AND t.section_id = %s"
+        params.append(section_id)
+    else:
+        section_filter = "AND t.section_id IS NULL"
+
+    cursor.execute(f'''
+        SELECT c.name, t.day, t.start_time, t.end_time, u.name, t.class_type, t.id, s.name
+        FROM timetable t
+        JOIN courses c ON c.id = t.course_id
+        LEFT JOIN sections s ON s.id = t.section_id
+        LEFT JOIN course_allocations ca
+          ON ca.course_id = t.course_id
+         AND ca.batch_id = t.batch_id
+         AND ca.department_id = t.department_id
+         AND ca.semester_id = t.semester_id
+        LEFT JOIN users u ON u.id = ca.teacher_id AND u.role = 'teacher'
+        WHERE t.batch_id = %s AND t.department_id = %s AND t.semester_id = %s
+        {section_filter}
+        ORDER BY t.start_time, s.name NULLS FIRST, t.id
+    ''', params)
+
+    slots = {}
+    for course, day, start_time, end_time, teacher, class_type, entry_id, section in cursor.fetchall():
+        days = slots.setdefault((start_time, end_time), dict.fromkeys(TIMETABLE_DAYS))
+        if day not in days:
+            continue
+        if all_sections and section:
+            course = f'{course} ({section})'
+        cell = days[day]
+        if cell is None:
+            days[day] = {
+                'course': course,
+                'teacher': teacher,
+                'class_type': class_type,
+                'entry_id': entry_id
+            }
+        elif all_sections:
+            # Sections that share a slot share the cell.
+            cell['course'] += f' / {course}'
+            if teacher and teacher != cell['teacher']:
+                cell['teacher'] = f"{cell['teacher']} / {teacher}" if cell['teacher'] else teacher
+            if class_type and class_type != cell['class_type']:
+                cell['class_type'] = f"{cell['class_type']} / {class_type}" if cell['class_type'] else class_type
+
+    cursor.close()
+    conn.close()
+
+    return [
+        {'start_time': start_time, 'end_time': end_time, 'days': days}
+        for (start_time, end_time), days in sorted(slots.items())
+    ]
+
+
+def timetable_grid(batch_id, department_id, semester_id, section_id=None):
+    """Rows of {'start_time', 'end_time', 'days': {day: entry or None}}.
+
+    The rows are shared between requests, so callers must not modify them.
+    """
+    key = _timetable_key(batch_id, department_id, semester_id, section_id)
+    return timetable_cache.get(key, lambda: _load_timetable_grid(*key))
+
+
+def invalidate_timetable(batch_id=None, department_id=None, semester_id=None, section_id=None):
+    """Drop one scope's grid, or every grid when no batch is given."""
+    if batch_id is None:
+        timetable_cache.invalidate()
+    else:
+        timetable_cache.invalidate(_timetable_key(batch_id, department_id, semester_id, section_id))
+        timetable_cache.invalidate(_timetable_key(batch_id, department_id, semester_id, TIMETABLE_ALL_SECTIONS))
+    schedule_cache.invalidate()
+
+
+# Weekly schedule index: every timetable entry keyed by
+# (batch, department, semester, section, course, weekday). The whole table
+# is small enough to load in one query, and mark_attendance looks it up on
+# every date or course change.
+WEEKDAY_NAMES = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+TIMETABLE_RANGE_MAX_DAYS = 62
+schedule_cache = VersionedCache('schedule')
+
+
+def _load_schedule_index():
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT batch_id, department_id, semester_id, section_id, course_id, day,
+               id, start_time, end_time, class_type
+        FROM timetable
+        ORDER BY start_time, id
+    ''')
+
+    index = {}
+    for batch_id, department_id, semester_id, section_id, course_id, day, *entry in cursor.fetchall():
+        key = (batch_id, department_id, semester_id, section_id, course_id, day)
+        index.setdefault(key, []).append({
+            'entry_id': entry[0],
+            'start_time': entry[1],
+            'end_time': entry[2],
+            'class_type': entry[3]
+        })
+
+    cursor.close()
+    conn.close()
+    return index
+
+
+def scheduled_classes(batch_id, department_id, semester_id, section_id, course_id, day_name):
+    """Timetable entries of a course on a weekday, ordered by start time."""
+    key = (_as_id(batch_id), _as_id(department_id), _as_id(semester_id),
+           _as_id(section_id), _as_id(course_id), day_name)
+    return schedule_cache.get('all', _load_schedule_index).get(key, [])
+
+
+# ---------------- STUDENT SEMESTER OVERVIEW ----------------
+# Everything view_attendance shows for one student and semester: each
+# course's totals and its sessions, from one query. Cached per student and
+# semester; writes of that student's attendance invalidate it.
+student_overview_cache = VersionedCache('student_overview', maxsize=4096, group=lambda key: key[0])
+
+
+def _load_semester_overview(student_id, batch_id, department_id, section_id, semester_id):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    section_filter = "AND c.section_id = %s" if section_id else "AND c.section_id IS NULL"
+    params = [student_id, batch_id, semester_id, semester_id, batch_id, department_id]
+    if section_id:
+        params.append(section_id)
+
+    cursor.execute(f'''
+        SELECT c.id, c.name,
+               COUNT(a.id) OVER w,
+               COUNT(a.id) FILTER (WHERE a.status = 'present') OVER w,
+               a.date, a.status, a.class_type, a.start_time, a.end_time
+        FROM courses c
+        LEFT JOIN attendance a
+          ON a.course_id = c.id
+         AND a.student_id = %s
+         AND a.batch_id = %s
+         AND a.semester_id = %s
+        WHERE c.semester_id = %s AND c.batch_id = %s AND c.department_id = %s
+        {section_filter}
+        WINDOW w AS (PARTITION BY c.id)
+        ORDER BY c.name, c.id, a.date DESC, a.start_time DESC
+    ''', params)
+    rows = cursor.fetchall()
+    cursor.close()
+    conn.close()
+
+    courses = {}
+    sessions = []
+    for course_id, name, total, present, *marked in rows:
+        if course_id not in courses:
+            courses[course_id] = {'id': course_id, 'name': name, 'total': total,
+                                  'present': present, 'sessions': []}
+        if marked[0] is not None:
+            sessions.append((course_id, *marked))
+
+    # Closed semesters may have been moved to the archive.
+    archived = read_archived_attendance(
+        batch_id, semester_id,
+        columns=['course_id', 'date', 'status', 'class_type', 'start_time', 'end_time'],
+        filters=[('student_id', '=', student_id)]
+    )
+    if archived is not None:
+        for r in archived.itertuples(index=False):
+            course = courses.get(r.course_id)
+            if course is None:
+                continue
+            course['total'] += 1
+            course['present'] += r.status == 'present'
+            sessions.append((r.course_id, r.date, r.status, r.class_type, r.start_time, r.end_time))
+        if not archived.empty:
+            sessions.sort(key=lambda s: (s[1], s[4]), reverse=True)
+
+    for course_id, day, status, class_type, start_time, end_time in sessions:
+        courses[course_id]['sessions'].append(
+            (day, status, courses[course_id]['name'], class_type,
+             format_time(start_time), format_time(end_time))
+        )
+
+    overview = list(courses.values())
+    for course in overview:
+        course['percentage'] = round(course['present'] * 100.0 / course['total'], 2) if course['total'] else 0
+    return overview
+
+
+def semester_overview(student_id, batch_id, department_id, section_id, semester_id):
+    """[{'id', 'name', 'total', 'present', 'percentage', 'sessions'}] by course name.
+
+    sessions are (date, status, course name, class type, start, end) tuples,
+    newest first, with times already formatted. The result is shared between
+    requests, so callers must not modify it.
+    """
+    key = (student_id, _as_id(semester_id))
+    return student_overview_cache.get(
+        key,
+        lambda: _load_semester_overview(student_id, batch_id, department_id, section_id, key[1])
+    )
+
+
+def invalidate_student_overview(student_ids=None):
+    """Drop the cached overviews of these students, or of everyone."""
+    if student_ids is None:
+        student_overview_cache.invalidate()
+    else:
+        student_overview_cache.invalidate_groups(student_ids)
+
+
+# ---------------- ATTENDANCE SUMMARY ----------------
+# attendance_summary keeps total/present counts per (student, course) so the
+# reports don't rescan raw attendance. Inserts, status updates and deletes
+# of attendance rows adjust it in the same statement; deleting a student or
+# course drops its summary rows through ON DELETE CASCADE.
+
+# Adds the rows of a CTE named {source} (student_id, course_id, status).
+SUMMARY_ADD_SQL = '''
+    INSERT INTO attendance_summary (student_id, course_id, total_count, present_count)
+    SELECT student_id, course_id, COUNT(*), COUNT(*) FILTER (WHERE status = 'present')
+    FROM {source}
+    GROUP BY student_id, course_id
+    ON CONFLICT (student_id, course_id) DO UPDATE
+    SET total_count = attendance_summary.total_count + EXCLUDED.total_count,
+        present_count = attendance_summary.present_count + EXCLUDED.present_count
+'''
+
+
+def delete_attendance_rows(cursor, where_sql, params):
+    """DELETE FROM attendance WHERE <where_sql>, keeping the summary exact.
+
+    Returns the number of attendance rows deleted.
+    """
+    cursor.execute(f'''
+        WITH deleted AS (
+            DELETE FROM attendance
+            WHERE {where_sql}
+            RETURNING student_id, course_id, status
+        ),
+        counts AS (
+            SELECT student_id, course_id,
+                   COUNT(*) AS total,
+                   COUNT(*) FILTER (WHERE status = 'present') AS present
+            FROM deleted
+            GROUP BY student_id, course_id
+        ),
+        adjusted AS (
+            UPDATE attendance_summary s
+            SET total_count = s.total_count - c.total,
+                present_count = s.present_count - c.present
+            FROM counts c
+            WHERE s.student_id = c.student_id AND s.course_id = c.course_id
+        )
+        SELECT COALESCE(SUM(total), 0) FROM counts
+    ''', params)
+    return cursor.fetchone()[0]
+
+
+def set_attendance_status(cursor, attendance_id, status):
+    """Change one attendance row's status, keeping the summary exact."""
+    cursor.execute('''
+        WITH old AS (
+            SELECT id, status FROM attendance WHERE id = %s FOR UPDATE
+        ),
+        updated AS (
+            UPDATE attendance a
+            SET status = %s
+            FROM old
+            WHERE a.id = old.id
+            RETURNING a.student_id, a.course_id, old.status AS old_status, a.status AS new_status
+        )
+        UPDATE attendance_summary s
+        SET present_count = s.present_count
+            + CASE WHEN u.new_status = 'present' THEN 1 ELSE 0 END
+            - CASE WHEN u.old_status = 'present' THEN 1 ELSE 0 END
+        FROM updated u
+        WHERE s.student_id = u.student_id AND s.course_id = u.course_id
+    ''', (attendance_id, status))
+
+
+# ---------------- ATTENDANCE ARCHIVE ----------------
+# A closed semester's attendance can be moved out of PostgreSQL into a
+# zstd-compressed Parquet file per batch and semester, next to a
+# manifest.json describing it. The rows leave attendance and their counts
+# leave attendance_summary, so the readers below add the archived rows back
+# in whenever that batch and semester are selected.
+app.config['ATTENDANCE_ARCHIVE_DIR'] = os.environ.get(
+    'ATTENDANCE_ARCHIVE_DIR', os.path.join(app.instance_path, 'attendance_archive')
+)
+ARCHIVE_COLUMNS = [
+    'id', 'student_id', 'course_id', 'batch_id', 'department_id', 'semester_id',
+    'section_id', 'date', 'start_time', 'end_time', 'status', 'class_type',
+]
+ARCHIVE_COMPRESSION = 'zstd'
+# Rows are sorted by student and course before writing, so per-row-group
+# min/max statistics let a filtered read skip most of the file.
+ARCHIVE_ROW_GROUP_SIZE = 50000
+ARCHIVE_MIN_AGE_DAYS = 30
+ARCHIVE_LOCK_KEY = 727102
+
+
+def _archive_dir(batch_id, semester_id):
+    return os.path.join(app.config['ATTENDANCE_ARCHIVE_DIR'], f'b{int(batch_id)}_s{int(semester_id)}')
+
+
+def attendance_archive(batch_id, semester_id):
+    """The manifest of an archived batch/semester, or None."""
+    try:
+        with open(os.path.join(_archive_dir(batch_id, semester_id), 'manifest.json')) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError, TypeError):
+        return None
+
+
+def read_archived_attendance(batch_id, semester_id, columns=None, filters=None):
+    """Archived rows for a batch/semester as a DataFrame, or None if none."""
+    for attempt in range(2):
+        manifest = attendance_archive(batch_id, semester_id)
+        if manifest is None:
+            return None
+        try:
+            return pd.read_parquet(
+                os.path.join(_archive_dir(batch_id, semester_id), manifest['file']),
+                engine='pyarrow', columns=columns, filters=filters
+            )
+        except FileNotFoundError:
+            # Re-archived between reading the manifest and the file.
+            if attempt:
+                raise
+
+
+def archived_attendance_counts(batch_id, semester_id, course_id=None):
+    """Per-student (ids, totals, presents) lists from the archive, or None.
+
+    The lists are shaped to be passed straight to unnest() in a report query.
+    """
+    filters = [('course_id', '=', int(course_id))] if course_id else None
+    df = read_archived_attendance(batch_id, semester_id, columns=['student_id', 'status'], filters=filters)
+    if df is None or df.empty:
+        return None
+
+    counts = (
+        df.assign(present=df['status'].eq('present'))
+          .groupby('student_id')
+          .agg(total=('status', 'size'), present=('present', 'sum'))
+    )
+    return (
+        counts.index.tolist(),
+        counts['total'].astype(int).tolist(),
+        counts['present'].astype(int).tolist(),
+    )
+
+
+def archived_course_counts(batch_id=None, department_id=None, semester_id=None):
+    """Per-(student, course) (ids, course ids, totals, presents) lists from
+    every archive matching the filters, or None.
+    """
+    root = app.config['ATTENDANCE_ARCHIVE_DIR']
+    if not os.path.isdir(root):
+        return None
+
+    filters = [('department_id', '=', int(department_id))] if department_id else None
+    frames = []
+    for name in sorted(os.listdir(root)):
+        match = re.fullmatch(r'b(\d+)_s(\d+)', name)
+        if not match:
+            continue
+        archive_batch, archive_semester = map(int, match.groups())
+        if (batch_id and archive_batch != int(batch_id)) or \
+                (semester_id and archive_semester != int(semester_id)):
+            continue
+        df = read_archived_attendance(archive_batch, archive_semester,
+                                      columns=['student_id', 'course_id', 'status'], filters=filters)
+        if df is not None and not df.empty:
+            frames.append(df)
+    if not frames:
+        return None
+
+    df = pd.concat(frames, ignore_index=True)
+    counts = (
+        df.assign(present=df['status'].eq('present'))
+          .groupby(['student_id', 'course_id'])
+          .agg(total=('status', 'size'), present=('present', 'sum'))
+    )
+    return (
+        counts.index.get_level_values('student_id').tolist(),
+        counts.index.get_level_values('course_id').astype(int).tolist(),
+        counts['total'].astype(int).tolist(),
+        counts['present'].astype(int).tolist(),
+    )
+
+
+def _write_archive(path, df):
+    df.to_parquet(
+        path, engine='pyarrow', index=False,
+        compression=ARCHIVE_COMPRESSION, row_group_size=ARCHIVE_ROW_GROUP_SIZE
+    )
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _write_manifest(directory, manifest, name='manifest.json'):
+    path = os.path.join(directory, name)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _publish_manifest(directory, previous):
+    """Swap manifest.pending.json in and delete the file it replaces."""
+    os.replace(os.path.join(directory, 'manifest.pending.json'),
+               os.path.join(directory, 'manifest.json'))
+    if previous is not None:
+        try:
+            os.remove(os.path.join(directory, previous['file']))
+        except FileNotFoundError:
+            pass
+
+
+def _finish_pending_archive(cursor, batch_id, semester_id):
+    """Settle a pending manifest left by a run that died around its commit.
+
+    If one of the rows it moved is still in attendance the commit never
+    happened and the pending file is dropped; otherwise it is published.
+    """
+    directory = _archive_dir(batch_id, semester_id)
+    try:
+        with open(os.path.join(directory, 'manifest.pending.json')) as f:
+            pending = json.load(f)
+    except FileNotFoundError:
+        return
+
+    cursor.execute('SELECT 1 FROM attendance WHERE batch_id = %s AND semester_id = %s AND id = %s',
+                   (batch_id, semester_id, pending['moved_id']))
+    if cursor.fetchone():
+        os.remove(os.path.join(directory, 'manifest.pending.json'))
+        try:
+            os.remove(os.path.join(directory, pending['file']))
+        except FileNotFoundError:
+            pass
+    else:
+        _publish_manifest(directory, attendance_archive(batch_id, semester_id))
+
+
+def archive_attendance(conn, batch_id, semester_id, min_age_days=ARCHIVE_MIN_AGE_DAYS):
+    """Move a batch/semester's attendance rows into its Parquet archive.
+
+    Rows already archived by an earlier run are kept; late rows are merged
+    in. The new manifest is written as manifest.pending.json and only
+    replaces manifest.json after the commit, so a row is never both archived
+    and live; a crash in between is settled by the next run. Returns the
+    manifest, or None if there was nothing to archive.
+    """
+    cursor = conn.cursor()
+    directory = _archive_dir(batch_id, semester_id)
+    new_path = None
+    committed = False
+
+    # One run per batch at a time, held until the manifest is published.
+    cursor.execute('SELECT pg_advisory_lock(%s, %s)', (ARCHIVE_LOCK_KEY, batch_id))
+    try:
+        _finish_pending_archive(cursor, batch_id, semester_id)
+        previous = attendance_archive(batch_id, semester_id)
+
+        cursor.execute('SELECT name FROM batches WHERE id = %s', (batch_id,))
+        batch = cursor.fetchone()
+        cursor.execute('SELECT name FROM semesters WHERE id = %s', (semester_id,))
+        semester = cursor.fetchone()
+        if not (batch and semester):
+            raise Exception('No such batch or semester.')
+
+        cursor.execute(f'''
+            SELECT {', '.join(ARCHIVE_COLUMNS)}
+            FROM attendance
+            WHERE batch_id = %s AND semester_id = %s
+            ORDER BY student_id, course_id, date, start_time
+            FOR UPDATE
+        ''', (batch_id, semester_id))
+        rows = cursor.fetchall()
+        if not rows:
+            conn.rollback()
+            return None
+
+        last_date = max(r[ARCHIVE_COLUMNS.index('date')] for r in rows)
+        if (date.today() - last_date).days < min_age_days:
+            raise Exception(
+                f'Attendance was marked on {last_date}; the semester is not closed '
+                f'(needs {min_age_days} days without attendance).'
+            )
+
+        df = pd.DataFrame(rows, columns=ARCHIVE_COLUMNS)
+        df['section_id'] = df['section_id'].astype('Int64')
+        df['status'] = df['status'].astype(str)
+        df['class_type'] = df['class_type'].astype(str)
+        if previous is not None:
+            df = pd.concat([read_archived_attendance(batch_id, semester_id), df], ignore_index=True)
+            df = df.sort_values(['student_id', 'course_id', 'date', 'start_time'], ignore_index=True)
+
+        os.makedirs(directory, exist_ok=True)
+        file_name = f'attendance-{uuid.uuid4().hex[:12]}.parquet'
+        new_path = os.path.join(directory, file_name)
+        sha256 = _write_archive(new_path, df)
+
+        delete_attendance_rows(
+            cursor, 'batch_id = %s AND semester_id = %s AND id = ANY(%s)',
+            (batch_id, semester_id, [r[0] for r in rows])
+        )
+        # Counts for these courses now live in the archive.
+        cursor.execute('''
+            DELETE FROM attendance_summary s
+            USING courses c
+            WHERE s.course_id = c.id
+              AND c.batch_id = %s AND c.semester_id = %s
+              AND s.total_count = 0
+        ''', (batch_id, semester_id))
+
+        manifest = {
+            'format_version': 1,
+            'batch_id': int(batch_id),
+            'batch_name': batch[0],
+            'semester_id': int(semester_id),
+            'semester_name': semester[0],
+            'file': file_name,
+            'sha256': sha256,
+            'bytes': os.path.getsize(new_path),
+            'compression': ARCHIVE_COMPRESSION,
+            'columns': ARCHIVE_COLUMNS,
+            'rows': len(df),
+            'first_date': df['date'].min().isoformat(),
+            'last_date': df['date'].max().isoformat(),
+            'archived_at': datetime.now().isoformat(timespec='seconds'),
+        }
+        _write_manifest(directory, dict(manifest, moved_id=rows[0][0]), 'manifest.pending.json')
+        try:
+            conn.commit()
+        except Exception:
+            os.remove(os.path.join(directory, 'manifest.pending.json'))
+            raise
+        committed = True
+        _publish_manifest(directory, previous)
+
+    except Exception:
+        conn.rollback()
+        # Once committed, the new file holds the only copy of the rows.
+        if new_path and not committed and os.path.exists(new_path):
+            os.remove(new_path)
+        raise
+
+    finally:
+        cursor.execute('SELECT pg_advisory_unlock(%s, %s)', (ARCHIVE_LOCK_KEY, batch_id))
+        conn.commit()
+        cursor.close()
+
+    return manifest
+
+
+def remove_batch_archives(batch_id):
+    root = app.config['ATTENDANCE_ARCHIVE_DIR']
+    if not os.path.isdir(root):
+        return
+    prefix = f'b{int(batch_id)}_s'
+    for name in os.listdir(root):
+        if name.startswith(prefix):
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+
+@app.cli.command('archive-attendance')
+@click.argument('batch_semester', nargs=-1, required=True, metavar='BATCH:SEMESTER...')
+@click.option('--min-age-days', default=ARCHIVE_MIN_AGE_DAYS, show_default=True,
+              help='Refuse semesters with attendance newer than this.')
+def archive_attendance_command(batch_semester, min_age_days):
+    """Move closed semesters' attendance into compressed Parquet files."""
+    targets = [_parse_batch_semester(value) for value in batch_semester]
+    conn = get_db_connection()
+    try:
+        for batch_id, semester_id in targets:
+            try:
+                manifest = archive_attendance(conn, batch_id, semester_id, min_age_days)
+            except Exception as e:
+                raise click.ClickException(f'{batch_id}:{semester_id}: {e}')
+            if manifest is None:
+                click.echo(f'{batch_id}:{semester_id}: nothing to archive')
+            else:
+                click.echo(
+                    f"{batch_id}:{semester_id}: {manifest['rows']} rows in "
+                    f"{manifest['file']} ({manifest['bytes']} bytes)"
+                )
+    finally:
+        conn.close()
+
+
+# ---------------- DEFERRED DELETES ----------------
+# Deleting a batch or department hides it at once (deleted_at) and queues a
+# purge job. The purge removes dependent rows course by course in small,
+# separately committed chunks, so it never holds long locks on attendance
+# while teachers are marking it.
+PURGE_TARGETS = {
+    'batch': ('batches', 'batch_id'),
+    'department': ('departments', 'department_id'),
+}
+PURGE_CHUNK_SIZE = 5000
+PURGE_PAUSE = 0.05   # seconds between chunks, to let live writes through
+PURGE_LOCK_KEY = 727101
+PURGE_RETRIES = 5
+PURGE_RETRY_DELAY = 30   # seconds before the first retry; doubles each time
+
+_purge_thread = None
+_purge_thread_lock = threading.Lock()
+
+
+def request_purge(cursor, kind, target_id):
+    """Hide a batch/department and queue its purge. The caller commits."""
+    table, column = PURGE_TARGETS[kind]
+
+    cursor.execute(f'''
+        SELECT EXISTS (SELECT 1 FROM users WHERE {column} = %s),
+               EXISTS (SELECT 1 FROM sections WHERE {column} = %s)
+    ''', (target_id, target_id))
+    has_users, has_sections = cursor.fetchone()
+    if has_users:
+        raise Exception(f'Users are still assigned to this {kind}.')
+    if has_sections:
+        raise Exception(f'Delete the sections of this {kind} first.')
+
+    cursor.execute(f'UPDATE {table} SET deleted_at = now() WHERE id = %s AND deleted_at IS NULL', (target_id,))
+    if cursor.rowcount:
+        cursor.execute('INSERT INTO purge_jobs (kind, target_id) VALUES (%s, %s)', (kind, target_id))
+
+
+def scope_is_live(cursor, batch_id, department_id):
+    """True if neither the batch nor the department is deleted.
+
+    Write paths call this before inserting rows that point at them. FOR SHARE
+    holds off a concurrent delete until the caller commits, so the purge never
+    races a new row in.
+    """
+    cursor.execute('''
+        SELECT (SELECT count(*) FROM (
+                    SELECT 1 FROM batches WHERE id = %s AND deleted_at IS NULL FOR SHARE
+                ) b)
+             + (SELECT count(*) FROM (
+                    SELECT 1 FROM departments WHERE id = %s AND deleted_at IS NULL FOR SHARE
+                ) d)
+    ''', (batch_id, department_id))
+    return cursor.fetchone()[0] == 2
+
+
+def _delete_attendance_in_chunks(conn, cursor, column, value):
+    while delete_attendance_rows(
+        cursor,
+        f'id IN (SELECT id FROM attendance WHERE {column} = %s LIMIT %s)',
+        (value, PURGE_CHUNK_SIZE)
+    ):
+        conn.commit()
+        time_module.sleep(PURGE_PAUSE)
+
+
+def _purge_target(conn, job_id, kind, target_id):
+    table, column = PURGE_TARGETS[kind]
+    cursor = conn.cursor()
+
+    cursor.execute(f'SELECT id FROM courses WHERE {column} = %s ORDER BY id', (target_id,))
+    course_ids = [r[0] for r in cursor.fetchall()]
+    conn.commit()
+
+    for course_id in course_ids:
+        _delete_attendance_in_chunks(conn, cursor, 'course_id', course_id)
+        cursor.execute('DELETE FROM timetable WHERE course_id = %s', (course_id,))
+        cursor.execute('DELETE FROM course_allocations WHERE course_id = %s', (course_id,))
+        cursor.execute('DELETE FROM courses WHERE id = %s', (course_id,))
+        conn.commit()
+
+    # Rows that point at the batch/department directly, not via its courses.
+    _delete_attendance_in_chunks(conn, cursor, column, target_id)
+    cursor.execute(f'DELETE FROM timetable WHERE {column} = %s', (target_id,))
+    cursor.execute(f'DELETE FROM course_allocations WHERE {column} = %s', (target_id,))
+    conn.commit()
+    if kind == 'batch':
+        # Empty by now; dropping it keeps the partition list short.
+        drop_batch_partition(conn, target_id)
+        remove_batch_archives(target_id)
+    cursor.execute(f'DELETE FROM {table} WHERE id = %s', (target_id,))
+    cursor.execute('UPDATE purge_jobs SET finished_at = now(), error = NULL WHERE id = %s', (job_id,))
     conn.commit()
-    conn.close()
+    cursor.close()
+
+
+def run_purge_jobs():
+    """Work through queued purge jobs once. Returns (finished, failed).
+
+    Each job is guarded by an advisory lock, so several workers (or the
+    purge-deleted command) can run this at the same time safely.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    finished = failed = 0
+
+    try:
+        cursor.execute('SELECT id, kind, target_id FROM purge_jobs WHERE finished_at IS NULL ORDER BY id')
+        jobs = cursor.fetchall()
+        conn.commit()
+
+        for job_id, kind, target_id in jobs:
+            cursor.execute('SELECT pg_try_advisory_lock(%s, %s)', (PURGE_LOCK_KEY, job_id))
+            if not cursor.fetchone()[0]:
+                continue  # another worker has it
+
+            try:
+                _purge_target(conn, job_id, kind, target_id)
+                finished += 1
+            except Exception as e:
+                conn.rollback()
+                app.logger.error("Purge job %s (%s %s) failed", job_id, kind, target_id, exc_info=True)
+                cursor.execute('UPDATE purge_jobs SET error = %s WHERE id = %s', (str(e), job_id))
+                conn.commit()
+                failed += 1
+            finally:
+                cursor.execute('SELECT pg_advisory_unlock(%s, %s)', (PURGE_LOCK_KEY, job_id))
+                conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
 
-def admin_exists():
+    if finished:
+        invalidate_timetable()
+        invalidate_dropdowns()
+        invalidate_student_overview()
+    return finished, failed
+
+
+def _purge_worker():
+    # A failed purge leaves its batch/department hidden and half deleted, so
+    # keep retrying it with backoff before giving up until the next start.
+    retries = 0
+    while True:
+        finished, failed = run_purge_jobs()
+        if failed and retries < PURGE_RETRIES:
+            time_module.sleep(PURGE_RETRY_DELAY * 2 ** retries)
+            retries += 1
+        elif finished:
+            retries = 0
+        else:
+            if failed:
+                app.logger.error("Giving up on %s failed purge job(s) after %s retries", failed, retries)
+            break
+
+
+def start_purge_worker():
+    """Run queued purges on a background thread of this worker process."""
+    global _purge_thread
+    with _purge_thread_lock:
+        if _purge_thread is None or not _purge_thread.is_alive():
+            _purge_thread = threading.Thread(target=_purge_worker, name='purge-deleted', daemon=True)
+            _purge_thread.start()
+
+
+@app.cli.command('purge-deleted')
+def purge_deleted_command():
+    """Finish purging deleted batches and departments."""
+    total = 0
+    while True:
+        finished, failed = run_purge_jobs()
+        if not finished:
+            break
+        total += finished
+    click.echo(f"{total} purge job(s) finished.")
+    if failed:
+        click.echo(f"{failed} purge job(s) failed; see purge_jobs.error.")
+
+
+# Cached "is there an admin yet?" flag, read by the nav on every render.
+# Once a worker has seen an admin it answers True from memory for good, so
+# rendering never touches the database. Only a "no" goes through admin_cache,
+# whose shared version tells this worker when another one registered an
+# admin. register_admin always asks the database itself.
+_admin_exists_flag = False
+admin_cache = VersionedCache('admin_exists')
+
+
+def _load_admin_exists():
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('SELECT * FROM users WHERE role = %s', ('admin',))
-    admin = cursor.fetchone()
+    cursor.execute('SELECT 1 FROM users WHERE role = %s LIMIT 1', ('admin',))
+    exists = cursor.fetchone() is not None
     conn.close()
-    return admin is not None
+    return exists
+
+
+def admin_exists(refresh=False):
+    global _admin_exists_flag
+    if _admin_exists_flag and not refresh:
+        return True
+    exists = _load_admin_exists() if refresh else admin_cache.get('flag', _load_admin_exists)
+    _admin_exists_flag = exists
+    return exists
+
+
+def invalidate_admin_exists():
+    global _admin_exists_flag
+    _admin_exists_flag = False
+    admin_cache.invalidate()
 
 @app.context_processor
 def utility_processor():
@@ -198,6 +1997,9 @@ def about():
     """Team information page"""
     return render_template('about.html')
 
+LOGIN_QUERY = 'SELECT id, name, password, role FROM users WHERE LOWER(email) = %s'
+
+
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     # Prevent logging in again if already logged in
@@ -213,15 +2015,15 @@ def login():
         conn = get_db_connection()
         cursor = conn.cursor()
 
-        # Ensure DB email is compared in lowercase too
-        cursor.execute('SELECT * FROM users WHERE LOWER(email) = %s', (email,))
+        # Ensure DB email is compared in lowercase too (idx_users_email_lower)
+        cursor.execute(LOGIN_QUERY, (email,))
         user = cursor.fetchone()
         conn.close()
 
-        if user and check_password_hash(user[3], password):
+        if user and check_password_hash(user[2], password):
             session['user_id'] = user[0]
             session['name'] = user[1]           # column index 1 = name
-            session['role'] = user[4].lower()   # normalize role
+            session['role'] = user[3].lower()   # normalize role
             session['logged_in'] = True         # login flag
 
             flash('Login successful!', 'success')
@@ -242,6 +2044,61 @@ def login():
     return render_template('login.html')
 
 
+@app.cli.command('bench-login')
+@click.option('--rows', multiple=True, type=int, default=(1000, 10000, 100000),
+              help='Synthetic user counts to time (repeatable).')
+@click.option('--lookups', default=2000, help='Logins timed per size.')
+def bench_login_command(rows, lookups):
+    """Time the login lookup with and without the LOWER(email) index.
+
+    Runs against a temporary copy of the users columns the query touches,
+    so real users are never read or written.
+    """
+    # LOGIN_QUERY, pointed at the temporary table.
+    query = 'SELECT id, name, password, role FROM bench_users WHERE LOWER(email) = %s'
+
+    with app.app_context():
+        conn = get_db_connection()
+        cursor = conn.cursor()
+
+        def time_lookups(n):
+            emails = [f'user{(i * 7919) % n}@example.edu' for i in range(lookups)]
+            started = time_module.perf_counter()
+            for email in emails:
+                cursor.execute(query, (email,))
+                cursor.fetchone()
+            return (time_module.perf_counter() - started) * 1e6 / lookups
+
+        try:
+            cursor.execute('''
+                CREATE TEMP TABLE bench_users (
+                    id TEXT PRIMARY KEY, name TEXT, email TEXT, password TEXT, role TEXT
+                )
+            ''')
+            click.echo(f"{'users':>7}  {'seq scan':>10}  {'indexed':>10}")
+            for n in rows:
+                cursor.execute('TRUNCATE bench_users')
+                cursor.execute('''
+                    INSERT INTO bench_users
+                    SELECT 'BBSUTSD-' || i, 'Student ' || i, 'User' || i || '@Example.edu',
+                           'x', 'student'
+                    FROM generate_series(0, %s - 1) AS i
+                ''', (n,))
+                cursor.execute('ANALYZE bench_users')
+                unindexed = time_lookups(n)
+
+                cursor.execute('CREATE INDEX bench_users_email_lower ON bench_users (LOWER(email))')
+                cursor.execute('ANALYZE bench_users')
+                indexed = time_lookups(n)
+                cursor.execute('DROP INDEX bench_users_email_lower')
+
+                click.echo(f"{n:>7}  {unindexed:>8.0f}us  {indexed:>8.0f}us")
+        finally:
+            conn.rollback()
+            cursor.close()
+            conn.close()
+
+
 # Logout route
 @app.route('/logout')
 def logout():
@@ -250,26 +2107,6 @@ def logout():
     return redirect(url_for('home'))
 
 
-def role_required(*roles):
-    def decorator(f):
-        @wraps(f)
-        def wrapper(*args, **kwargs):
-            # Check login first
-            if not session.get('logged_in'):
-                flash('You must log in first.', 'warning')
-                return redirect(url_for('login'))
-
-            current_role = session.get('role')
-
-            # Check if user's role is allowed
-            if current_role not in [r.lower() for r in roles]:
-                flash('Access Denied! Please use your own dashboard.', 'warning')
-                return redirect(url_for(f"{current_role}_dashboard"))
-
-            return f(*args, **kwargs)
-        return wrapper
-    return decorator
-
 @app.route('/admin', endpoint='admin_dashboard')
 @role_required('admin')
 def admin_dashboard():
@@ -285,6 +2122,12 @@ def teacher_dashboard():
 def student_dashboard():
     return render_template('student.html')
 
+@app.route('/admin/db_pool_stats')
+@role_required('admin')
+def admin_db_pool_stats():
+    """Connection pool checkout/wait counters for this worker."""
+    return jsonify(db_pool_stats())
+
 
 
 @app.route('/admin/manage_sections', methods=['GET', 'POST'])
@@ -300,12 +2143,16 @@ def manage_sections():
             batch_id = request.form['batch_id']
             department_id = request.form['department_id']
 
+            if not scope_is_live(cursor, batch_id, department_id):
+                raise Exception('That batch or department has been deleted.')
+
             cursor.execute('''
                 INSERT INTO sections (name, batch_id, department_id)
                 VALUES (%s, %s, %s)
             ''', (section_name, batch_id, department_id))
 
             conn.commit()
+            invalidate_reference_data()
             flash('Section added successfully!', 'success')
 
         # ---------------- DELETE SECTION ----------------
@@ -317,6 +2164,7 @@ def manage_sections():
 
             cursor.execute('DELETE FROM sections WHERE id=%s', (section_id,))
             conn.commit()
+            invalidate_reference_data()
             flash('Section deleted successfully.', 'success')
 
     except Exception as e:
@@ -326,11 +2174,9 @@ def manage_sections():
 
     # ---------------- FETCH DATA FOR PAGE ----------------
 
-    cursor.execute('SELECT id, name FROM batches ORDER BY name')
-    batches = cursor.fetchall()
+    batches = reference_rows('batches')
 
-    cursor.execute('SELECT id, name FROM departments ORDER BY name')
-    departments = cursor.fetchall()
+    departments = reference_rows('departments')
 
     cursor.execute('''
         SELECT
@@ -369,17 +2215,7 @@ def check_sections():
     batch_id = request.args.get('batch_id')
     department_id = request.args.get('department_id')
 
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT id, name FROM sections
-        WHERE batch_id=%s AND department_id=%s
-        ORDER BY name
-    ''', (batch_id, department_id))
-    rows = cursor.fetchall()
-    conn.close()
-
-    return jsonify(rows)
+    return jsonify(sections_for(batch_id, department_id))
 
 @app.route('/admin/manage_users', methods=['GET', 'POST'])
 @role_required('admin')
@@ -417,6 +2253,9 @@ def manage_users():
                 if batch_status == 'new':
                     admission_date = request.form['admission_date']
 
+                if not scope_is_live(cursor, batch_id, department_id):
+                    raise Exception('That batch or department has been deleted.')
+
             cursor.execute('''
                 INSERT INTO users
                 (id, name, email, password, role,
@@ -430,6 +2269,8 @@ def manage_users():
             ))
 
             conn.commit()
+            if role == 'admin':
+                invalidate_admin_exists()
             flash('User registered successfully!', 'success')
 
         except Exception as e:
@@ -441,142 +2282,401 @@ def manage_users():
 
         return redirect(url_for('manage_users'))
 
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT id, name FROM batches ORDER BY name')
-    batches = cursor.fetchall()
-    cursor.execute('SELECT id, name FROM departments ORDER BY name')
-    departments = cursor.fetchall()
-    conn.close()
+    batches = reference_rows('batches')
+    departments = reference_rows('departments')
 
     return render_template('manage_users.html', batches=batches, departments=departments)
 
 
-@app.route('/admin/import_users', methods=['POST'])
-@role_required('admin')
-def import_users():
+# ---------------- BULK USER IMPORT ----------------
+# Uploaded rows are streamed into a temp staging table with COPY, validated
+# with set-based joins (every bad row is reported at once), then inserted
+# with a single INSERT ... SELECT.
+IMPORT_COLUMNS = (
+    'user_id', 'name', 'email', 'password', 'role',
+    'batch_id', 'department_id', 'section_name',
+    'batch_status', 'admission_date'
+)
 
-    if 'csv_file' not in request.files:
-        flash('No file uploaded.', 'danger')
-        return redirect(url_for('manage_users'))
+# How many validation errors to show in the flash message.
+IMPORT_MAX_REPORTED_ERRORS = 50
 
-    file = request.files['csv_file']
-    if file.filename == '' or not file.filename.endswith('.csv'):
-        flash('Invalid CSV file.', 'danger')
-        return redirect(url_for('manage_users'))
 
+class CsvCopySource:
+    """File-like object that feeds an iterator of rows to COPY ... FROM STDIN.
+
+    Rows are only pulled from the iterator as psycopg2 asks for more data,
+    so the upload is never held in memory as a whole.
+    """
+
+    def __init__(self, rows):
+        self._rows = iter(rows)
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer, lineterminator='\n')
+        self._pending = ''
+        self._exhausted = False
+
+    def read(self, size=-1):
+        while not self._exhausted and (size < 0 or len(self._pending) < size):
+            try:
+                self._writer.writerow(next(self._rows))
+            except StopIteration:
+                self._exhausted = True
+                break
+            self._pending += self._buffer.getvalue()
+            self._buffer.seek(0)
+            self._buffer.truncate()
+
+        if size < 0:
+            chunk, self._pending = self._pending, ''
+        else:
+            chunk, self._pending = self._pending[:size], self._pending[size:]
+        return chunk
+
+
+def _iter_import_rows(file):
+    """Yield (line_no, *IMPORT_COLUMNS) from an uploaded CSV, one row at a time."""
+    stream = io.TextIOWrapper(file.stream, encoding='utf-8-sig', newline='')
+    # Line 1 is the header row.
+    for line_no, row in enumerate(csv.DictReader(stream), start=2):
+        yield (line_no,) + tuple((row.get(col) or '').strip() for col in IMPORT_COLUMNS)
+
+
+def _stage_import(cursor, file):
+    cursor.execute('''
+        CREATE TEMP TABLE import_staging (
+            line_no INTEGER PRIMARY KEY,
+            user_id TEXT,
+            name TEXT,
+            email TEXT,
+            password TEXT,
+            role TEXT,
+            batch_id TEXT,
+            department_id TEXT,
+            section_name TEXT,
+            batch_status TEXT,
+            admission_date TEXT
+        ) ON COMMIT DROP
+    ''')
+    cursor.copy_expert(
+        'COPY import_staging FROM STDIN WITH (FORMAT csv)',
+        CsvCopySource(_iter_import_rows(file))
+    )
+
+    # Resolve batch / department / section ids once for the whole file.
+    cursor.execute('''
+        CREATE TEMP TABLE import_resolved ON COMMIT DROP AS
+        SELECT s.line_no,
+               b.id AS batch_id, b.name AS batch_name,
+               d.id AS department_id, d.name AS department_name,
+               sec.id AS section_id,
+               hs.batch_id IS NOT NULL AS has_sections
+        FROM import_staging s
+        -- The CASE guards the cast: with a hash or merge join the key is
+        -- computed before any other join condition, so "12a" or an id past
+        -- the int range would otherwise abort the whole import.
+        LEFT JOIN batches b
+               ON b.id = CASE WHEN s.batch_id ~ '^[0-9]{1,9}$' THEN s.batch_id::int END
+              AND b.deleted_at IS NULL
+        LEFT JOIN departments d
+               ON d.id = CASE WHEN s.department_id ~ '^[0-9]{1,9}$' THEN s.department_id::int END
+              AND d.deleted_at IS NULL
+        LEFT JOIN (SELECT DISTINCT batch_id, department_id FROM sections) hs
+               ON hs.batch_id = b.id AND hs.department_id = d.id
+        LEFT JOIN sections sec
+               ON sec.batch_id = b.id AND sec.department_id = d.id
+              AND sec.name = s.section_name
+        WHERE s.role = 'student'
+    ''')
+
+
+def _import_errors(cursor):
+    """Return [(line_no, message)] for every invalid staged row."""
+    cursor.execute("""
+        SELECT line_no, msg FROM (
+            SELECT line_no, 'Missing user_id, name, email or role' AS msg
+            FROM import_staging
+            WHERE user_id IS NULL OR name IS NULL OR email IS NULL OR role IS NULL
+
+            UNION ALL
+            SELECT line_no,
+                   'Password must be at least 8 characters for user ID ' || COALESCE(user_id, '')
+            FROM import_staging
+            WHERE LENGTH(COALESCE(password, '')) < 8
+
+            UNION ALL
+            SELECT line_no, 'Duplicate user ID ' || user_id || ' in file'
+            FROM (
+                SELECT line_no, user_id,
+                       ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY line_no) AS rn
+                FROM import_staging
+                WHERE user_id IS NOT NULL
+            ) dup
+            WHERE rn > 1
+
+            UNION ALL
+            SELECT line_no, 'Duplicate email ' || email || ' in file'
+            FROM (
+                SELECT line_no, email,
+                       ROW_NUMBER() OVER (PARTITION BY email ORDER BY line_no) AS rn
+                FROM import_staging
+                WHERE email IS NOT NULL
+            ) dup
+            WHERE rn > 1
+
+            UNION ALL
+            SELECT s.line_no, 'User ID ' || s.user_id || ' already exists'
+            FROM import_staging s
+            JOIN users u ON u.id = s.user_id
+
+            UNION ALL
+            SELECT s.line_no, 'Email ' || s.email || ' already exists'
+            FROM import_staging s
+            JOIN users u ON u.email = s.email
+
+            UNION ALL
+            SELECT s.line_no, 'Unknown batch ID ' || COALESCE(s.batch_id, '')
+            FROM import_staging s
+            JOIN import_resolved r USING (line_no)
+            WHERE r.batch_id IS NULL
+
+            UNION ALL
+            SELECT s.line_no, 'Unknown department ID ' || COALESCE(s.department_id, '')
+            FROM import_staging s
+            JOIN import_resolved r USING (line_no)
+            WHERE r.department_id IS NULL
+
+            UNION ALL
+            SELECT r.line_no,
+                   'Section exists for ' || r.batch_name || ' & ' || r.department_name
+                   || ', but CSV has empty section_name.'
+            FROM import_staging s
+            JOIN import_resolved r USING (line_no)
+            WHERE r.has_sections AND s.section_name IS NULL
+
+            UNION ALL
+            SELECT r.line_no,
+                   'No sections exist for ' || r.batch_name || ' & ' || r.department_name
+                   || ', but CSV provided section ''' || s.section_name || '''.'
+            FROM import_staging s
+            JOIN import_resolved r USING (line_no)
+            WHERE r.batch_id IS NOT NULL AND r.department_id IS NOT NULL
+              AND NOT r.has_sections AND s.section_name IS NOT NULL
+
+            UNION ALL
+            SELECT r.line_no,
+                   'Invalid ''' || s.section_name || ''' for '
+                   || r.batch_name || ' & ' || r.department_name
+            FROM import_staging s
+            JOIN import_resolved r USING (line_no)
+            WHERE r.has_sections AND s.section_name IS NOT NULL AND r.section_id IS NULL
+        ) errors
+        ORDER BY line_no
+    """)
+    return cursor.fetchall()
+
+
+# ---------------- PARALLEL PASSWORD HASHING ----------------
+# Werkzeug's password hashes are deliberately slow, so bulk imports fan the
+# work out over a process pool sized to the machine's cores.
+app.config['HASH_WORKERS'] = int(os.environ.get('HASH_WORKERS', os.cpu_count() or 1))
+HASH_CHUNK_SIZE = 32
+
+_hash_executor = None
+_hash_executor_lock = threading.Lock()
+
+# Progress of the running import, per admin: {'done': n, 'total': n, ...}.
+# Kept in a JSON file so the progress poll can land on any web worker.
+app.config['IMPORT_PROGRESS_DIR'] = os.environ.get(
+    'IMPORT_PROGRESS_DIR', os.path.join(tempfile.gettempdir(), 'attendance_import_progress')
+)
+
+
+def _get_hash_executor():
+    global _hash_executor
+    with _hash_executor_lock:
+        if _hash_executor is None:
+            # spawn, not fork: the web worker is multi-threaded.
+            _hash_executor = ProcessPoolExecutor(
+                max_workers=app.config['HASH_WORKERS'],
+                mp_context=multiprocessing.get_context('spawn')
+            )
+    return _hash_executor
+
+
+def _hash_password_chunk(passwords):
+    return [generate_password_hash(pw) for pw in passwords]
+
+
+def hash_passwords(passwords, progress=None):
+    """Hash passwords on the worker pool, returning hashes in input order.
+
+    progress(done, total) is called after each chunk finishes.
+    """
+    total = len(passwords)
+    if app.config['HASH_WORKERS'] <= 1 or total <= HASH_CHUNK_SIZE:
+        hashes = _hash_password_chunk(passwords)
+        if progress:
+            progress(total, total)
+        return hashes
+
+    executor = _get_hash_executor()
+    futures = [
+        executor.submit(_hash_password_chunk, passwords[i:i + HASH_CHUNK_SIZE])
+        for i in range(0, total, HASH_CHUNK_SIZE)
+    ]
+
+    hashes = []
+    for future in futures:
+        hashes.extend(future.result())
+        if progress:
+            progress(len(hashes), total)
+    return hashes
+
+
+def _import_progress_path(user_id):
+    name = hashlib.sha256(str(user_id).encode()).hexdigest()
+    return os.path.join(app.config['IMPORT_PROGRESS_DIR'], f'{name}.json')
+
+
+def read_import_progress(user_id):
     try:
-        stream = io.StringIO(file.stream.read().decode("UTF8"), newline=None)
-        csv_input = list(csv.DictReader(stream))
+        with open(_import_progress_path(user_id)) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {'phase': 'idle'}
 
-        conn = get_db_connection()
-        cursor = conn.cursor()
 
-        # ------------------ PRE-VALIDATION ------------------
+def _set_import_progress(user_id, **fields):
+    # Only the worker running this admin's import writes the file.
+    progress = read_import_progress(user_id)
+    progress.update(fields)
+    os.makedirs(app.config['IMPORT_PROGRESS_DIR'], exist_ok=True)
+    path = _import_progress_path(user_id)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(progress, f)
+    os.replace(tmp_path, path)
 
-        for row in csv_input:
-            role = (row.get('role') or '').strip()
 
-            raw_password = (row.get('password') or '').strip()
-            if len(raw_password) < 8:
-                raise Exception(
-                    f"Password must be at least 8 characters for user ID {row.get('user_id')}"
-                )
+@app.route('/admin/import_users/progress')
+@role_required('admin')
+def import_users_progress():
+    """Progress of this admin's running import."""
+    return jsonify(read_import_progress(session['user_id']))
 
-            if role == 'student':
-                batch_id = (row.get('batch_id') or '').strip()
-                department_id = (row.get('department_id') or '').strip()
-                section_name = (row.get('section_name') or '').strip() or None
 
-                # fetch batch & dept names
-                cursor.execute('SELECT name FROM batches WHERE id=%s', (batch_id,))
-                batch_res = cursor.fetchone()
-                batch_name = batch_res[0] if batch_res else f"Unknown(ID:{batch_id})"
+@app.cli.command('bench-password-hashing')
+@click.option('--rows', multiple=True, type=int, default=(100, 500, 2000),
+              help='Row counts to time (repeatable).')
+def bench_password_hashing_command(rows):
+    """Compare serial and pooled password hashing throughput."""
+    workers = app.config['HASH_WORKERS']
+    # Start the worker processes before timing anything.
+    hash_passwords([f'warmup-{i}' for i in range(workers * HASH_CHUNK_SIZE + 1)])
 
-                cursor.execute('SELECT name FROM departments WHERE id=%s', (department_id,))
-                dept_res = cursor.fetchone()
-                dept_name = dept_res[0] if dept_res else f"Unknown(ID:{department_id})"
+    click.echo(f"{'rows':>7}  {'serial/s':>10}  {'pooled/s':>10}  speedup  ({workers} workers)")
+    for n in rows:
+        passwords = [f'password-{i:06d}' for i in range(n)]
 
-                cursor.execute('''
-                    SELECT id FROM sections
-                    WHERE batch_id=%s AND department_id=%s
-                ''', (batch_id, department_id))
-                sections = cursor.fetchall()
-
-                if sections and not section_name:
-                    raise Exception(
-                        f"Section exists for {batch_name} & {dept_name}, "
-                        f"but CSV has empty section_name."
-                    )
+        started = time_module.perf_counter()
+        _hash_password_chunk(passwords)
+        serial = time_module.perf_counter() - started
 
-                if not sections and section_name:
-                    raise Exception(
-                        f"No sections exist for {batch_name} & {dept_name}, "
-                        f"but CSV provided section '{section_name}'."
-                    )
+        started = time_module.perf_counter()
+        hash_passwords(passwords)
+        pooled = time_module.perf_counter() - started
 
-        # ------------------ ACTUAL INSERT ------------------
+        click.echo(f"{n:>7}  {n / serial:>10.1f}  {n / pooled:>10.1f}  {serial / pooled:>6.1f}x")
 
-        for row in csv_input:
-            user_id = (row.get('user_id') or '').strip()
-            name = (row.get('name') or '').strip()
-            email = (row.get('email') or '').strip()
-            password = generate_password_hash((row.get('password') or '').strip())
-            role = (row.get('role') or '').strip()
 
-            batch_id = None
-            department_id = None
-            section_id = None
-            batch_status = None
-            admission_date = None
+def _hash_import_passwords(cursor, progress=None):
+    cursor.execute('SELECT line_no, password FROM import_staging ORDER BY line_no')
+    rows = cursor.fetchall()
+    hashes = hash_passwords([pw for _, pw in rows], progress=progress)
 
-            if role == 'student':
-                batch_id = (row.get('batch_id') or '').strip()
-                department_id = (row.get('department_id') or '').strip()
-                batch_status = (row.get('batch_status') or '').strip()
-                section_name = (row.get('section_name') or '').strip() or None
-
-                if section_name:
-                    cursor.execute('''
-                        SELECT id FROM sections
-                        WHERE name=%s AND batch_id=%s AND department_id=%s
-                    ''', (section_name, batch_id, department_id))
-                    res = cursor.fetchone()
-
-                    cursor.execute('SELECT name FROM batches WHERE id=%s', (batch_id,))
-                    batch_res = cursor.fetchone()
-                    batch_name = batch_res[0] if batch_res else f"Unknown(ID:{batch_id})"
-
-                    cursor.execute('SELECT name FROM departments WHERE id=%s', (department_id,))
-                    dept_res = cursor.fetchone()
-                    dept_name = dept_res[0] if dept_res else f"Unknown(ID:{department_id})"
-
-                    if not res:
-                        raise Exception(
-                            f"Invalid '{section_name}' for {batch_name} & {dept_name}"
-                        )
-                    section_id = res[0]
+    cursor.execute('''
+        CREATE TEMP TABLE import_hashes (
+            line_no INTEGER PRIMARY KEY,
+            password_hash TEXT NOT NULL
+        ) ON COMMIT DROP
+    ''')
+    cursor.copy_expert(
+        'COPY import_hashes FROM STDIN WITH (FORMAT csv)',
+        CsvCopySource((line_no, pw_hash) for (line_no, _), pw_hash in zip(rows, hashes))
+    )
 
-                if batch_status == 'new':
-                    admission_date = (row.get('admission_date') or '').strip()
 
-            cursor.execute('''
-                INSERT INTO users
-                (id, name, email, password, role,
-                 batch_id, department_id, section_id,
-                 batch_status, admission_date)
-                VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
-            ''', (
-                user_id, name, email, password, role,
-                batch_id, department_id, section_id,
-                batch_status, admission_date
-            ))
+def _insert_staged_users(cursor):
+    cursor.execute('''
+        INSERT INTO users
+        (id, name, email, password, role,
+         batch_id, department_id, section_id,
+         batch_status, admission_date)
+        SELECT s.user_id, s.name, s.email, h.password_hash, s.role,
+               r.batch_id, r.department_id, r.section_id,
+               CASE WHEN s.role = 'student' THEN s.batch_status END,
+               CASE WHEN s.role = 'student' AND s.batch_status = 'new'
+                    THEN s.admission_date END
+        FROM import_staging s
+        JOIN import_hashes h USING (line_no)
+        LEFT JOIN import_resolved r USING (line_no)
+        ORDER BY s.line_no
+    ''')
+    return cursor.rowcount
+
+
+@app.route('/admin/import_users', methods=['POST'])
+@role_required('admin')
+def import_users():
+
+    if 'csv_file' not in request.files:
+        flash('No file uploaded.', 'danger')
+        return redirect(url_for('manage_users'))
+
+    file = request.files['csv_file']
+    if file.filename == '' or not file.filename.endswith('.csv'):
+        flash('Invalid CSV file.', 'danger')
+        return redirect(url_for('manage_users'))
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    admin_id = session['user_id']
+    started = time_module.monotonic()
+    _set_import_progress(admin_id, phase='staging', done=0, total=None, started_at=time_module.time())
+
+    try:
+        # ------------------ STAGE ------------------
+        _stage_import(cursor, file)
+
+        # ------------------ VALIDATE ------------------
+        errors = _import_errors(cursor)
+        if errors:
+            shown = [f"Line {line_no}: {msg}" for line_no, msg in errors[:IMPORT_MAX_REPORTED_ERRORS]]
+            if len(errors) > IMPORT_MAX_REPORTED_ERRORS:
+                shown.append(f"... and {len(errors) - IMPORT_MAX_REPORTED_ERRORS} more")
+            raise Exception(
+                f"Import rejected, {len(errors)} problem(s) found: " + '; '.join(shown)
+            )
+
+        # ------------------ INSERT ------------------
+        _set_import_progress(admin_id, phase='hashing')
+        _hash_import_passwords(
+            cursor,
+            progress=lambda done, total: _set_import_progress(admin_id, done=done, total=total)
+        )
+        _set_import_progress(admin_id, phase='inserting')
+        inserted = _insert_staged_users(cursor)
 
         conn.commit()
-        flash('Users imported successfully!', 'success')
+        _set_import_progress(admin_id, phase='done')
+        app.logger.info("Imported %s users in %.1fs", inserted, time_module.monotonic() - started)
+        flash(f'{inserted} users imported successfully!', 'success')
 
     except Exception as e:
         conn.rollback()
+        _set_import_progress(admin_id, phase='failed')
         print(e)
         flash(str(e), 'danger')
 
@@ -656,6 +2756,10 @@ def allocate_course():
         cursor = conn.cursor()
 
         try:
+            if not scope_is_live(cursor, batch_id, department_id):
+                flash("That batch or department has been deleted.", "danger")
+                return redirect(url_for('allocate_course'))
+
             if force_update:
 
                 cursor.execute("""
@@ -687,6 +2791,8 @@ def allocate_course():
                 flash("Course allocated successfully!", "success")
 
             conn.commit()
+            invalidate_timetable()
+            invalidate_dropdowns()
 
         except Exception as e:
             conn.rollback()
@@ -709,14 +2815,11 @@ def allocate_course():
     cursor.execute("SELECT id, name FROM users WHERE role='teacher'")
     teachers = cursor.fetchall()
 
-    cursor.execute('SELECT id, name FROM batches')
-    batches = cursor.fetchall()
+    batches = reference_rows('batches', order_by='id')
 
-    cursor.execute('SELECT id, name FROM departments')
-    departments = cursor.fetchall()
+    departments = reference_rows('departments', order_by='id')
 
-    cursor.execute('SELECT id, name FROM semesters')
-    semesters = cursor.fetchall()
+    semesters = reference_rows('semesters', order_by='id')
 
     conn.close()
 
@@ -799,11 +2902,9 @@ def view_students():
         # -----------------------------
         # Dropdown Data
         # -----------------------------
-        cursor.execute('SELECT * FROM batches')
-        batches = cursor.fetchall()
+        batches = reference_rows('batches', order_by='id')
 
-        cursor.execute('SELECT * FROM departments')
-        departments = cursor.fetchall()
+        departments = reference_rows('departments', order_by='id')
 
         # -----------------------------
         # Form Submit
@@ -859,7 +2960,7 @@ def view_students():
                       AND users.batch_id = %s
                       AND users.department_id = %s
                       AND users.section_id = %s
-                    ORDER BY CAST(SUBSTRING(users.id FROM '(\\d+)$') AS INTEGER)
+                    ORDER BY users.id_sort_key, users.id
                 ''', (selected_batch, selected_department, selected_section))
 
                 students = cursor.fetchall()
@@ -882,7 +2983,7 @@ def view_students():
                     WHERE users.role = 'student'
                       AND users.batch_id = %s
                       AND users.department_id = %s
-                    ORDER BY CAST(SUBSTRING(users.id FROM '(\\d+)$') AS INTEGER)
+                    ORDER BY users.id_sort_key, users.id
                 ''', (selected_batch, selected_department))
 
                 students = cursor.fetchall()
@@ -930,6 +3031,10 @@ def update_student(student_id):
         cursor = conn.cursor()
 
         try:
+            if not scope_is_live(cursor, batch_id, department_id):
+                flash('That batch or department has been deleted.', 'error')
+                return redirect(url_for('update_student', student_id=student_id))
+
             if new_password:
                 hashed_password = generate_password_hash(new_password)
                 cursor.execute('''
@@ -954,6 +3059,7 @@ def update_student(student_id):
                 ''', (name, email, batch_id, department_id, section_id, student_id))
 
             conn.commit()
+            invalidate_student_overview([student_id])
             flash('Student updated successfully!', 'success')
             return redirect(url_for('view_students'))
 
@@ -972,19 +3078,12 @@ def update_student(student_id):
     cursor.execute('SELECT * FROM users WHERE id=%s', (student_id,))
     student = cursor.fetchone()
 
-    cursor.execute('SELECT id, name FROM batches ORDER BY name')
-    batches = cursor.fetchall()
+    batches = reference_rows('batches')
 
-    cursor.execute('SELECT id, name FROM departments ORDER BY name')
-    departments = cursor.fetchall()
+    departments = reference_rows('departments')
 
     # preload sections for student's current batch+dept
-    cursor.execute('''
-        SELECT id, name FROM sections
-        WHERE batch_id=%s AND department_id=%s
-        ORDER BY name
-    ''', (student[5], student[6]))
-    sections = cursor.fetchall()
+    sections = sections_for(student[5], student[6])
 
     conn.close()
 
@@ -1016,6 +3115,8 @@ def delete_student(student_id):
             (student_id,)
         )
         conn.commit()
+        invalidate_admin_exists()
+        invalidate_student_overview([student_id])
 
         flash("Student deleted successfully!", "success")
 
@@ -1033,6 +3134,65 @@ def delete_student(student_id):
     
 
 
+# Archived per-student counts, as the same (student_id, total_count,
+# present_count) rows attendance_summary gives the report queries.
+ARCHIVED_COUNTS_SQL = '''
+    SELECT * FROM unnest(%s::text[], %s::int[], %s::int[])
+        AS a(student_id, total_count, present_count)
+'''
+
+
+def admin_report_query(batch_id, department_id, semester_id, section_id=None):
+    """Attendance report query and params for one batch/department/semester."""
+    archived = archived_attendance_counts(batch_id, semester_id)
+
+    query = '''
+        SELECT u.id, u.name,
+               SUM(s.total_count) AS total_days,
+               SUM(s.present_count) AS present_days,
+               CASE WHEN SUM(s.total_count)=0 THEN 0.00
+                    ELSE ROUND(SUM(s.present_count)*100.0/SUM(s.total_count),2)
+               END AS percentage
+        FROM users u
+        JOIN (
+            SELECT s.student_id, s.total_count, s.present_count
+            FROM attendance_summary s
+            JOIN courses c ON s.course_id = c.id
+            WHERE c.semester_id=%s
+    '''
+    params = [semester_id]
+
+    if archived:
+        query += ' UNION ALL ' + ARCHIVED_COUNTS_SQL
+        params.extend(archived)
+
+    query += '''
+        ) s ON u.id = s.student_id
+        WHERE u.role='student'
+          AND u.batch_id=%s
+          AND u.department_id=%s
+    '''
+    params.extend([batch_id, department_id])
+
+    if section_id:
+        query += ' AND u.section_id = %s '
+        params.append(section_id)
+
+    query += '''
+        GROUP BY u.id, u.name
+        HAVING SUM(s.total_count) > 0
+        ORDER BY u.id_sort_key, u.id
+    '''
+    return query, tuple(params)
+
+
+def report_title(batch_name, dept_name, semester_name, section_name=None):
+    title = f"{batch_name}-{dept_name}"
+    if section_name:
+        title += f"-{section_name}"
+    return title + f"-{semester_name}"
+
+
 @app.route('/admin/generate_reports', methods=['GET', 'POST'])
 @role_required("admin")
 def admin_generate_reports():
@@ -1052,14 +3212,11 @@ def admin_generate_reports():
 
     try:
         # ------------------ DROPDOWNS ------------------
-        cursor.execute('SELECT id, name FROM batches ORDER BY name')
-        batches = cursor.fetchall()
+        batches = reference_rows('batches')
 
-        cursor.execute('SELECT id, name FROM departments ORDER BY name')
-        departments = cursor.fetchall()
+        departments = reference_rows('departments')
 
-        cursor.execute('SELECT id, name FROM semesters ORDER BY id')
-        semesters = cursor.fetchall()
+        semesters = reference_rows('semesters', order_by='id')
 
         # ------------------ FORM SUBMIT ------------------
         if request.method == 'POST':
@@ -1092,61 +3249,24 @@ def admin_generate_reports():
                 return redirect(url_for('admin_generate_reports'))
 
             # ------------------ NAMES ------------------
-            cursor.execute('SELECT name FROM batches WHERE id=%s', (batch_id,))
-            batch_name = cursor.fetchone()[0]
-
-            cursor.execute('SELECT name FROM departments WHERE id=%s', (department_id,))
-            dept_name = cursor.fetchone()[0]
-
-            cursor.execute('SELECT name FROM semesters WHERE id=%s', (semester_id,))
-            semester_name = cursor.fetchone()[0]
+            batch_name = reference_name('batches', batch_id)
+            dept_name = reference_name('departments', department_id)
+            semester_name = reference_name('semesters', semester_id)
 
             if section_id:
-                cursor.execute('SELECT name FROM sections WHERE id=%s', (section_id,))
-                r = cursor.fetchone()
-                section_name = r[0] if r else None
+                section_name = reference_name('sections', section_id)
 
             # ------------------ REPORT QUERY ------------------
 
-            base_query = '''
-                SELECT u.id, u.name,
-                       COUNT(a.id) AS total_days,
-                       COALESCE(SUM(CASE WHEN a.status='present' THEN 1 ELSE 0 END),0) AS present_days,
-                       CASE WHEN COUNT(a.id)=0 THEN 0.00
-                            ELSE ROUND(SUM(CASE WHEN a.status='present' THEN 1 ELSE 0 END)*100.0/COUNT(a.id),2)
-                       END AS percentage
-                FROM users u
-                LEFT JOIN attendance a ON u.id = a.student_id
-                LEFT JOIN courses c ON a.course_id = c.id
-                WHERE u.role='student'
-                  AND u.batch_id=%s
-                  AND u.department_id=%s
-                  AND c.semester_id=%s
-            '''
-
-            params = [batch_id, department_id, semester_id]
-
-            if section_id:
-                base_query += ' AND u.section_id = %s '
-                params.append(section_id)
+            base_query, params = admin_report_query(batch_id, department_id, semester_id, section_id)
+            title = report_title(batch_name, dept_name, semester_name, section_name)
 
-            base_query += '''
-                GROUP BY u.id, u.name
-                ORDER BY CAST(SUBSTRING(u.id FROM '(\\d+)$') AS INTEGER)
-            '''
+            if 'export_csv' in request.form:
+                return stream_csv_export(base_query, params, title)
 
-            cursor.execute(base_query, tuple(params))
+            cursor.execute(base_query, params)
             report_data = cursor.fetchall()
 
-            title = f"{batch_name}-{dept_name}"
-            if section_name:
-                title += f"-{section_name}"
-            title += f"-{semester_name}"
-
-
-            if 'export_csv' in request.form:
-                return export_csv(report_data, title)
-
             if 'export_pdf' in request.form:
                 return export_pdf(report_data, title)
 
@@ -1176,6 +3296,137 @@ def admin_generate_reports():
         conn.close()
 
 
+app.config['DEFAULTER_THRESHOLD'] = float(os.environ.get('DEFAULTER_THRESHOLD', 75))
+DEFAULTER_PREVIEW_ROWS = 200
+DEFAULTER_HEADER = [
+    'Department', 'Batch', 'Section', 'Semester', 'Student ID', 'Name', 'Course',
+    'Total Classes', 'Present', 'Course (%)', 'Semester (%)', 'Short Courses', 'Classes Needed'
+]
+
+
+def defaulter_report_query(threshold, batch_id=None, department_id=None, semester_id=None):
+    """Every (student, course) below threshold percent, in one pass.
+
+    Per-semester totals and the number of short courses per student come
+    from window functions over the same attendance_summary scan. "Classes
+    Needed" is how many consecutive presents would reach the threshold.
+    Archived semesters' counts are added back in, as in the admin report.
+    """
+    filters = ''
+    filter_params = []
+    for column, value in (('batch_id', batch_id), ('department_id', department_id), ('semester_id', semester_id)):
+        if value:
+            filters += f' AND c.{column} = %s'
+            filter_params.append(value)
+
+    archived = archived_course_counts(batch_id, department_id, semester_id)
+    counts = 'attendance_summary'
+    archived_params = []
+    if archived:
+        # Late rows marked after archiving sit in attendance_summary too.
+        counts = '''(
+            SELECT student_id, course_id,
+                   SUM(total_count) AS total_count, SUM(present_count) AS present_count
+            FROM (
+                SELECT student_id, course_id, total_count, present_count FROM attendance_summary
+                UNION ALL
+                SELECT * FROM unnest(%s::text[], %s::int[], %s::int[], %s::int[])
+                    AS a(student_id, course_id, total_count, present_count)
+            ) all_counts
+            GROUP BY student_id, course_id
+        )'''
+        archived_params = list(archived)
+
+    query = f'''
+        WITH course_counts AS (
+            SELECT s.student_id, s.course_id, c.semester_id,
+                   s.total_count, s.present_count,
+                   SUM(s.total_count) OVER w AS semester_total,
+                   SUM(s.present_count) OVER w AS semester_present,
+                   COUNT(*) FILTER (WHERE s.present_count * 100.0 < %s * s.total_count) OVER w AS short_courses
+            FROM {counts} s
+            JOIN courses c ON c.id = s.course_id
+            WHERE s.total_count > 0 {filters}
+            WINDOW w AS (PARTITION BY s.student_id, c.semester_id)
+        )
+        SELECT d.name, b.name, sec.name, sem.name, u.id, u.name, co.name,
+               cc.total_count, cc.present_count,
+               ROUND(cc.present_count * 100.0 / cc.total_count, 2),
+               ROUND(cc.semester_present * 100.0 / cc.semester_total, 2),
+               cc.short_courses,
+               CEIL((%s * cc.total_count - 100.0 * cc.present_count) / (100 - %s))::int
+        FROM course_counts cc
+        JOIN users u ON u.id = cc.student_id AND u.role = 'student'
+        JOIN courses co ON co.id = cc.course_id
+        JOIN batches b ON b.id = u.batch_id AND b.deleted_at IS NULL
+        JOIN departments d ON d.id = u.department_id AND d.deleted_at IS NULL
+        JOIN semesters sem ON sem.id = cc.semester_id
+        LEFT JOIN sections sec ON sec.id = u.section_id
+        WHERE cc.present_count * 100.0 < %s * cc.total_count
+        ORDER BY d.name, b.name, sec.name NULLS FIRST, sem.id, u.id_sort_key, u.id, co.name
+    '''
+    params = [threshold, *archived_params, *filter_params, threshold, threshold, threshold]
+    return query, tuple(params)
+
+
+@app.route('/admin/defaulters')
+@role_required("admin")
+def admin_defaulters():
+    batch_id = request.args.get('batch_id') or None
+    department_id = request.args.get('department_id') or None
+    semester_id = request.args.get('semester_id') or None
+
+    threshold = app.config['DEFAULTER_THRESHOLD']
+    if request.args.get('threshold'):
+        try:
+            threshold = float(request.args['threshold'])
+        except ValueError:
+            threshold = -1
+        if not 0 < threshold < 100:
+            flash("Threshold must be a percentage between 0 and 100.", "warning")
+            return redirect(url_for('admin_defaulters'))
+
+    query, params = defaulter_report_query(threshold, batch_id, department_id, semester_id)
+
+    title = f"Defaulters below {threshold:g}%"
+    for table, value in (('batches', batch_id), ('departments', department_id), ('semesters', semester_id)):
+        if value:
+            title += f"-{reference_name(table, value)}"
+
+    if request.args.get('export') == 'csv':
+        return stream_csv_export(query, params, title, header=DEFAULTER_HEADER)
+
+    rows = []
+    more = False
+    if request.args.get('run'):
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(query + ' LIMIT %s', params + (DEFAULTER_PREVIEW_ROWS + 1,))
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+            conn.close()
+        more = len(rows) > DEFAULTER_PREVIEW_ROWS
+        rows = rows[:DEFAULTER_PREVIEW_ROWS]
+
+    return render_template(
+        'admin_defaulters.html',
+        batches=reference_rows('batches'),
+        departments=reference_rows('departments'),
+        semesters=reference_rows('semesters', order_by='id'),
+        header=DEFAULTER_HEADER,
+        rows=rows,
+        more=more,
+        ran=bool(request.args.get('run')),
+        threshold=threshold,
+        selected_batch=batch_id,
+        selected_department=department_id,
+        selected_semester=semester_id,
+        title=title
+    )
+
+
 @app.route('/teacher/generate_reports', methods=['GET', 'POST'])
 @role_required("teacher")
 def teacher_generate_reports():
@@ -1214,21 +3465,16 @@ def teacher_generate_reports():
         # -------------------------------
         # Load master dropdown data
         # -------------------------------
-        cursor.execute('SELECT * FROM batches ORDER BY name')
-        batches = cursor.fetchall()
+        batches = reference_rows('batches')
 
-        cursor.execute('SELECT * FROM departments ORDER BY name')
-        departments = cursor.fetchall()
+        departments = reference_rows('departments')
 
-        cursor.execute('SELECT * FROM semesters ORDER BY name')
-        semesters = cursor.fetchall()
+        semesters = reference_rows('semesters')
 
         
         section_name = None
         if selected_section:
-            cursor.execute('SELECT name FROM sections WHERE id=%s', (selected_section,))
-            r = cursor.fetchone()
-            section_name = r[0] if r else None
+            section_name = reference_name('sections', selected_section)
 
         # -------------------------------
         # Read filters (GET first)
@@ -1249,19 +3495,13 @@ def teacher_generate_reports():
             selected_course = request.form.get('course_id')
 
         if selected_batch:
-            cursor.execute('SELECT name FROM batches WHERE id=%s', (selected_batch,))
-            r = cursor.fetchone()
-            batch_name = r[0] if r else ''
+            batch_name = reference_name('batches', selected_batch) or ''
 
         if selected_department:
-            cursor.execute('SELECT name FROM departments WHERE id=%s', (selected_department,))
-            r = cursor.fetchone()
-            dept_name = r[0] if r else ''
+            dept_name = reference_name('departments', selected_department) or ''
 
         if selected_semester:
-            cursor.execute('SELECT name FROM semesters WHERE id=%s', (selected_semester,))
-            r = cursor.fetchone()
-            semester_name = r[0] if r else ''
+            semester_name = reference_name('semesters', selected_semester) or ''
 
         if selected_course:
             cursor.execute('SELECT name FROM courses WHERE id=%s', (selected_course,))
@@ -1269,9 +3509,7 @@ def teacher_generate_reports():
             course_name = r[0] if r else ''
 
         if selected_section:
-            cursor.execute('SELECT name FROM sections WHERE id=%s', (selected_section,))
-            r = cursor.fetchone()
-            section_name = r[0] if r else ''
+            section_name = reference_name('sections', selected_section) or ''
 
         # -------------------------------
         # Load courses if filters ready
@@ -1347,46 +3585,59 @@ def teacher_generate_reports():
             # -------------------------------
             # Attendance report query
             # -------------------------------
+            archived = archived_attendance_counts(selected_batch, selected_semester, selected_course)
+            if archived:
+                summary_sql = '''
+                    (SELECT student_id,
+                            SUM(total_count) AS total_count,
+                            SUM(present_count) AS present_count
+                     FROM (
+                         SELECT student_id, total_count, present_count
+                         FROM attendance_summary WHERE course_id=%s
+                         UNION ALL
+                ''' + ARCHIVED_COUNTS_SQL + '''
+                     ) counts
+                     GROUP BY student_id) s ON u.id=s.student_id
+                '''
+                summary_params = [selected_course, *archived]
+            else:
+                summary_sql = 'attendance_summary s ON u.id=s.student_id AND s.course_id=%s'
+                summary_params = [selected_course]
+
+            report_query = f'''
+                SELECT u.id, u.name,
+                       COALESCE(s.total_count, 0),
+                       COALESCE(s.present_count, 0),
+                       CASE WHEN COALESCE(s.total_count, 0)=0 THEN 0
+                            ELSE ROUND(s.present_count*100.0/s.total_count,2)
+                       END
+                FROM users u
+                LEFT JOIN {summary_sql}
+                WHERE u.role='student'
+                  AND u.batch_id=%s AND u.department_id=%s
+            '''
+            report_params = summary_params + [selected_batch, selected_department]
+
             if selected_section:
-                cursor.execute('''
-                    SELECT u.id, u.name,
-                           COUNT(a.id),
-                           COALESCE(SUM(CASE WHEN a.status='present' THEN 1 ELSE 0 END),0),
-                           CASE WHEN COUNT(a.id)=0 THEN 0
-                                ELSE ROUND(SUM(CASE WHEN a.status='present' THEN 1 ELSE 0 END)*100.0/COUNT(a.id),2)
-                           END
-                    FROM users u
-                    LEFT JOIN attendance a ON u.id=a.student_id AND a.course_id=%s
-                    WHERE u.role='student'
-                      AND u.batch_id=%s AND u.department_id=%s AND u.section_id=%s
-                    GROUP BY u.id, u.name
-                    ORDER BY CAST(SUBSTRING(u.id FROM '(\\d+)$') AS INTEGER)
-                ''', (selected_course, selected_batch, selected_department, selected_section))
+                report_query += ' AND u.section_id=%s '
+                report_params.append(selected_section)
             else:
-                cursor.execute('''
-                    SELECT u.id, u.name,
-                           COUNT(a.id),
-                           COALESCE(SUM(CASE WHEN a.status='present' THEN 1 ELSE 0 END),0),
-                           CASE WHEN COUNT(a.id)=0 THEN 0
-                                ELSE ROUND(SUM(CASE WHEN a.status='present' THEN 1 ELSE 0 END)*100.0/COUNT(a.id),2)
-                           END
-                    FROM users u
-                    LEFT JOIN attendance a ON u.id=a.student_id AND a.course_id=%s
-                    WHERE u.role='student'
-                      AND u.batch_id=%s AND u.department_id=%s AND u.section_id IS NULL
-                    GROUP BY u.id, u.name
-                    ORDER BY CAST(SUBSTRING(u.id FROM '(\\d+)$') AS INTEGER)
-                ''', (selected_course, selected_batch, selected_department))
+                report_query += ' AND u.section_id IS NULL '
+
+            report_query += '''
+                ORDER BY u.id_sort_key, u.id
+            '''
 
-            report_data = cursor.fetchall()
             title = f"Attendance Report for {batch_name}, Department: {dept_name}"
             if section_name:
                 title += f", {section_name}"
             title += f", {semester_name}, Course: {course_name}"
 
-
             if 'export_csv' in request.form:
-                return export_csv(report_data, title)
+                return stream_csv_export(report_query, tuple(report_params), title)
+
+            cursor.execute(report_query, tuple(report_params))
+            report_data = cursor.fetchall()
 
             if 'export_pdf' in request.form:
                 return export_pdf(report_data, title)
@@ -1437,6 +3688,52 @@ def teacher_generate_reports():
 
 
 
+REPORT_HEADER = ['Student ID', 'Name', 'Total Days', 'Present Days', 'Percentage (%)']
+
+# Rows fetched per round trip by the server-side export cursor, and bytes
+# buffered before a chunk is sent to the client.
+EXPORT_FETCH_SIZE = 2000
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+
+def stream_csv_export(query, params, title, header=REPORT_HEADER):
+    """Stream a report query to the client as CSV.
+
+    Rows come off a server-side (named) cursor EXPORT_FETCH_SIZE at a time
+    and are written out in small chunks, so memory stays flat however many
+    rows the query returns.
+    """
+    def generate():
+        conn = get_db_connection()
+        cursor = conn.cursor(name='csv_export')
+        cursor.itersize = EXPORT_FETCH_SIZE
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(header)
+
+        try:
+            cursor.execute(query, params)
+            for row in cursor:
+                writer.writerow(row)
+                if buffer.tell() >= EXPORT_CHUNK_BYTES:
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+            yield buffer.getvalue()
+        finally:
+            cursor.close()
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/csv",
+        headers={
+            "Content-Disposition": f"attachment;filename={slugify(title)}.csv",
+            "Content-Type": "text/csv; charset=utf-8"
+        }
+    )
+
+
 def export_csv(data, title):
     try:
         # Create a StringIO buffer for CSV data
@@ -1446,7 +3743,7 @@ def export_csv(data, title):
         
         
         # Write header
-        writer.writerow(['Student ID', 'Name', 'Total Days', 'Present Days', 'Percentage (%)'])
+        writer.writerow(REPORT_HEADER)
         
         # Write data rows
         for row in data:
@@ -1467,85 +3764,482 @@ def export_csv(data, title):
         flash(f'CSV export failed: {str(e)}', 'error')
         return redirect(url_for('admin_generate_reports'))
 
-def export_pdf(data, title):
-    try:
-        # Create a buffer for PDF data
-        buffer = io.BytesIO()
-        
-        # Create PDF document
-        doc = SimpleDocTemplate(buffer, pagesize=letter)
-        elements = []
-        styles = getSampleStyleSheet()
+@app.cli.command('bench-csv-export')
+@click.option('--rows', multiple=True, type=int, default=(10000, 100000, 500000),
+              help='Report sizes to export (repeatable).')
+def bench_csv_export_command(rows):
+    """Compare peak Python memory of the streamed and buffered CSV exports."""
+    query = '''
+        SELECT 'BBSUTSD-' || i, 'Student Name ' || i, 40, 35, 87.5
+        FROM generate_series(1, %s) AS i
+    '''
+
+    click.echo(f"{'rows':>8}  {'csv MB':>7}  {'streamed peak':>13}  {'buffered peak':>13}")
+    for n in rows:
+        with app.test_request_context():
+            tracemalloc.start()
+            response = stream_csv_export(query, (n,), 'bench')
+            size = sum(len(chunk) for chunk in response.response)
+            streamed = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            tracemalloc.start()
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            cursor.execute(query, (n,))
+            export_csv(cursor.fetchall(), 'bench').get_data()
+            cursor.close()
+            buffered = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+        click.echo(f"{n:>8}  {size / 2**20:>7.1f}  {streamed / 2**20:>10.2f} MB  {buffered / 2**20:>10.2f} MB")
 
-        try:
-            # Add Logo (adjust width/height as needed)
-            logo = Image('static/uni_logo.png', width=1*inch, height=1*inch)
-            logo.hAlign = 'CENTER'
-            elements.append(logo)
-        except Exception as e:
-            # If logo not found, continue without it
-            pass
 
-        # University Title
-        uni_title = Paragraph(
-            "<para align='center'><b>BENAZIR BHUTTO SHAHEED UNIVERSITY OF TECHNOLOGY AND SKILL DEVELOPMENT KHAIRPUR</b></para>",
-            styles['Title']
-        )
-        elements.append(uni_title)
-        elements.append(Spacer(1, 0.2 * inch))
-        
-        # Add title
-        elements.append(Paragraph(title, styles['Title']))
-        elements.append(Spacer(1, 12))
-        
-        # Create table data
-        table_data = [['Student ID', 'Name', 'Total Days', 'Present Days', 'Percentage (%)']]
-        for row in data:
-            table_data.append([str(item) for item in row])
-        
-        # Create table
-        table = Table(table_data)
-        table.setStyle(TableStyle([
+# ---------------- PDF REPORT ENGINE ----------------
+UNIVERSITY_NAME = "BENAZIR BHUTTO SHAHEED UNIVERSITY OF TECHNOLOGY AND SKILL DEVELOPMENT KHAIRPUR"
+LOGO_PATH = os.path.join(app.root_path, 'static', 'uni_logo.png')
+
+# Report tables use fixed column widths, and a fixed height for rows whose
+# text fits on one line, so reportlab rarely has to measure cell contents.
+# A cell too wide for its column is wrapped in a Paragraph and its row sizes
+# itself.
+PDF_REPORT_COL_WIDTHS = [90, 168, 60, 70, 80]
+PDF_ROW_HEIGHT = 16
+PDF_CELL_PADDING = 12   # reportlab's default 6pt left + right
+PDF_CELL_FONT = ('Helvetica', 9)
+# Rendered PDFs stay in memory up to this size, then spill to a temp file.
+PDF_SPOOL_BYTES = 4 * 1024 * 1024
+
+
+class PdfLogo(Flowable):
+    """Draws the shared, already decoded university logo."""
+
+    def __init__(self, reader, size=1 * inch):
+        super().__init__()
+        self.reader = reader
+        self.width = self.height = size
+        self.hAlign = 'CENTER'
+
+    def wrap(self, avail_width, avail_height):
+        return self.width, self.height
+
+    def draw(self):
+        self.canv.drawImage(self.reader, 0, 0, self.width, self.height, mask='auto')
+
+
+@lru_cache(maxsize=None)
+def pdf_assets():
+    """Styles, table styles and the decoded logo, built once per process."""
+    styles = getSampleStyleSheet()
+
+    try:
+        logo = ImageReader(LOGO_PATH)
+        logo.getRGBData()  # decode now rather than once per document
+    except Exception:
+        # If logo not found, continue without it
+        logo = None
+
+    return {
+        'styles': styles,
+        'logo': logo,
+        'table_content': ParagraphStyle(
+            name='TableContent',
+            parent=styles['Normal'],
+            fontSize=8,   # smaller font size
+            alignment=1,  # center alignment
+            leading=10,   # line spacing
+        ),
+        'report_cell': ParagraphStyle(
+            name='ReportCell',
+            parent=styles['Normal'],
+            fontName=PDF_CELL_FONT[0],
+            fontSize=PDF_CELL_FONT[1],
+            alignment=1,
+            leading=11,
+        ),
+        'report_header': ParagraphStyle(
+            name='ReportHeader',
+            parent=styles['Normal'],
+            fontName='Helvetica-Bold',
+            fontSize=10,
+            textColor=colors.white,
+            alignment=1,
+            leading=12,
+        ),
+        'report_table': TableStyle([
             ('BACKGROUND', (0,0), (-1,0), colors.HexColor('#00BFF')),
             ('TEXTCOLOR', (0,0), (-1,0), colors.white),
             ('ALIGN', (0,0), (-1,-1), 'CENTER'),
+            ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
             ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
             ('FONTSIZE', (0,0), (-1,0), 10),
-            ('BOTTOMPADDING', (0,0), (-1,0), 12),
+            ('FONTSIZE', (0,1), (-1,-1), 9),
             ('BACKGROUND', (0,1), (-1,-1), colors.HexColor('#F8F9FA')),
             ('GRID', (0,0), (-1,-1), 1, colors.HexColor('#DEE2E6'))
-        ]))
-        
+        ]),
+    }
+
+
+def pdf_heading(title, space_after=12):
+    """Logo, university name and document title flowables."""
+    assets = pdf_assets()
+    elements = []
+    if assets['logo'] is not None:
+        elements.append(PdfLogo(assets['logo']))
+    elements.append(Paragraph(f"<para align='center'><b>{UNIVERSITY_NAME}</b></para>", assets['styles']['Title']))
+    elements.append(Spacer(1, 0.2 * inch))
+    elements.append(Paragraph(title, assets['styles']['Title']))
+    elements.append(Spacer(1, space_after))
+    return elements
+
+
+def build_report_pdf(rows, title, output, header=REPORT_HEADER):
+    """Render report rows as a PDF into output and return the page count.
+
+    Rows are laid out as one table per page, each repeating the header row.
+    A single huge table is re-split on every page break, which makes
+    rendering quadratic in the row count; page-sized tables keep it linear.
+    """
+    assets = pdf_assets()
+    doc = SimpleDocTemplate(output, pagesize=letter)
+    elements = pdf_heading(title)
+
+    header_row = [Paragraph(str(h), assets['report_header']) for h in header]
+    _, header_height = Table([header_row], colWidths=PDF_REPORT_COL_WIDTHS).wrap(doc.width, doc.height)
+
+    # The frame loses 6pt of padding top and bottom.
+    body_height = doc.height - 12 - header_height
+    heading_height = 0
+    for flowable in elements:
+        _, height = flowable.wrap(doc.width, doc.height)
+        heading_height += height + flowable.getSpaceBefore() + flowable.getSpaceAfter()
+
+    rows_per_page = max(1, int(body_height // PDF_ROW_HEIGHT))
+    # Leave a row of slack on the first page for rounding in the heading.
+    first_page_rows = max(1, int((body_height - heading_height) // PDF_ROW_HEIGHT) - 1)
+
+    fits = [width - PDF_CELL_PADDING for width in PDF_REPORT_COL_WIDTHS]
+    # No Helvetica glyph is wider than 1.02em, so shorter text always fits
+    # and is never measured.
+    safe_lengths = [int(fit / (PDF_CELL_FONT[1] * 1.02)) for fit in fits]
+    cells, heights = [], []
+    for row in rows:
+        row = [str(item) for item in row]
+        wrapped = False
+        for i, text in enumerate(row):
+            if len(text) > safe_lengths[i] and stringWidth(text, *PDF_CELL_FONT) > fits[i]:
+                row[i] = Paragraph(escape(text), assets['report_cell'])
+                wrapped = True
+        cells.append(row)
+        heights.append(None if wrapped else PDF_ROW_HEIGHT)
+
+    # Rows that wrap make a page's table too tall for its page; it then
+    # splits, and the rest carries over ahead of the next page's table.
+    start, size = 0, first_page_rows
+    while True:
+        table = Table(
+            [header_row] + cells[start:start + size],
+            colWidths=PDF_REPORT_COL_WIDTHS,
+            rowHeights=[None] + heights[start:start + size],
+            repeatRows=1
+        )
+        table.setStyle(assets['report_table'])
         elements.append(table)
-        doc.build(elements)
-        
-        # Create Flask response
-        buffer.seek(0)
-        response = Response(
-            buffer.getvalue(),
+        start += size
+        size = rows_per_page
+        if start >= len(cells):
+            break
+
+    doc.build(elements)
+    return doc.page
+
+
+def export_pdf(data, title):
+    try:
+        output = tempfile.SpooledTemporaryFile(max_size=PDF_SPOOL_BYTES)
+        build_report_pdf(data, title, output)
+        output.seek(0)
+        return send_file(
+            output,
             mimetype="application/pdf",
-            headers={
-                "Content-Disposition": f"attachment;filename={slugify(title)}.pdf",
-                "Content-Type": "application/pdf"
-            }
+            as_attachment=True,
+            download_name=f"{slugify(title)}.pdf"
         )
-        return response
-        
+
     except Exception as e:
         flash(f'PDF export failed: {str(e)}', 'error')
         return redirect(url_for('admin_generate_reports'))
 
 
+@app.cli.command('bench-pdf')
+@click.option('--rows', multiple=True, type=int, default=(100, 1000, 10000),
+              help='Report sizes to render (repeatable).')
+@click.option('--long-names', is_flag=True,
+              help='Give every fifth student a name that wraps onto two lines.')
+def bench_pdf_command(rows, long_names):
+    """Time report PDF rendering and print the cost per page."""
+    pdf_assets()
+    for count in rows:
+        data = [
+            (f'BBSUTSD-{i:05d}',
+             f'Student Name {i} Muhammad Abdul Rehman Khan' if long_names and i % 5 == 0 else f'Student Name {i}',
+             40, 35, 87.5)
+            for i in range(count)
+        ]
+        started = time_module.perf_counter()
+        pages = build_report_pdf(data, 'PDF Benchmark', io.BytesIO())
+        elapsed = time_module.perf_counter() - started
+        click.echo(
+            f"{count:>7} rows  {pages:>5} pages  {elapsed:8.2f}s  "
+            f"{elapsed * 1000 / pages:8.1f} ms/page"
+        )
+
+
+# ---------------- REPORT JOBS ----------------
+# Heavy exports run on a small, low-priority process pool of their own, so
+# web workers stay free for interactive requests. Job state lives in JSON
+# files next to the finished output, which every web worker can read.
+#
+# REPORT_JOB_WORKERS sizes the pool of each web process, so with N gunicorn
+# workers up to N * REPORT_JOB_WORKERS exports can run at once. Only
+# REPORT_JOB_MAX_PENDING is counted across processes, from the shared job
+# directory. A queued or running job whose state file has not been touched
+# for REPORT_JOB_TIMEOUT seconds (its pool died with a restart, or the worker
+# was killed) is marked failed by the next sweep, so it stops holding a slot.
+app.config['REPORT_JOB_DIR'] = os.environ.get(
+    'REPORT_JOB_DIR', os.path.join(tempfile.gettempdir(), 'attendance_report_jobs')
+)
+app.config['REPORT_JOB_WORKERS'] = int(os.environ.get('REPORT_JOB_WORKERS', 2))
+app.config['REPORT_JOB_MAX_PENDING'] = int(os.environ.get('REPORT_JOB_MAX_PENDING', 8))
+app.config['REPORT_JOB_TTL'] = int(os.environ.get('REPORT_JOB_TTL', 24 * 3600))
+app.config['REPORT_JOB_TIMEOUT'] = int(os.environ.get('REPORT_JOB_TIMEOUT', 30 * 60))
+REPORT_JOB_NICE = 10
+REPORT_JOB_FORMATS = {'csv': 'text/csv', 'pdf': 'application/pdf'}
+REPORT_JOB_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+
+_report_executor = None
+_report_executor_lock = threading.Lock()
+
+
+def _report_job_worker_init():
+    # Let the web workers win any contention for the CPU.
+    if hasattr(os, 'nice'):
+        os.nice(REPORT_JOB_NICE)
+
+
+def _get_report_executor():
+    global _report_executor
+    with _report_executor_lock:
+        if _report_executor is None:
+            _report_executor = ProcessPoolExecutor(
+                max_workers=app.config['REPORT_JOB_WORKERS'],
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_report_job_worker_init
+            )
+    return _report_executor
+
+
+def _report_job_path(job_id, ext='json'):
+    return os.path.join(app.config['REPORT_JOB_DIR'], f'{job_id}.{ext}')
+
+
+def read_report_job(job_id):
+    if not REPORT_JOB_ID_RE.match(job_id or ''):
+        return None
+    try:
+        with open(_report_job_path(job_id)) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _update_report_job(job_id, **fields):
+    # Only one process writes a job at a time: the submitter until the job
+    # is queued, then the worker running it. Every write doubles as the
+    # heartbeat the sweep checks.
+    state = read_report_job(job_id) or {}
+    state.update(fields, updated_at=time_module.time())
+    path = _report_job_path(job_id)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+    return state
+
+
+def _sweep_report_jobs():
+    """Delete expired jobs, fail stalled ones and return how many are still
+    queued or running."""
+    os.makedirs(app.config['REPORT_JOB_DIR'], exist_ok=True)
+    now = time_module.time()
+    expires_before = now - app.config['REPORT_JOB_TTL']
+    stalled_before = now - app.config['REPORT_JOB_TIMEOUT']
+    pending = 0
+
+    for name in os.listdir(app.config['REPORT_JOB_DIR']):
+        job_id, ext = os.path.splitext(name)
+        if ext != '.json':
+            continue
+        state = read_report_job(job_id)
+        if state is None:
+            continue
+        if state['created_at'] < expires_before:
+            for ext in ['json'] + list(REPORT_JOB_FORMATS):
+                try:
+                    os.remove(_report_job_path(job_id, ext))
+                except FileNotFoundError:
+                    pass
+        elif state['status'] in ('queued', 'running'):
+            if state.get('updated_at', state['created_at']) < stalled_before:
+                _update_report_job(
+                    job_id,
+                    status='failed',
+                    error='The report job stopped responding. Please try again.',
+                    finished_at=now
+                )
+            else:
+                pending += 1
+
+    return pending
+
+
+def _run_report_job(job_id, query, params, title, fmt):
+    """Build one report file. Runs in a report job worker process."""
+    _update_report_job(job_id, status='running', started_at=time_module.time())
+    output_path = _report_job_path(job_id, fmt)
+    partial_path = output_path + '.part'
+    conn = None
+    rows = 0
+
+    try:
+        conn = psycopg2.connect(app.config['DB_DSN'])
+        cursor = conn.cursor(name='report_job')
+        cursor.itersize = EXPORT_FETCH_SIZE
+        cursor.execute(query, params)
+
+        if fmt == 'csv':
+            with open(partial_path, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                writer.writerow(REPORT_HEADER)
+                for row in cursor:
+                    writer.writerow(row)
+                    rows += 1
+                    if rows % EXPORT_FETCH_SIZE == 0:
+                        _update_report_job(job_id, rows=rows)
+        else:
+            data = []
+            for row in cursor:
+                data.append(row)
+                if len(data) % EXPORT_FETCH_SIZE == 0:
+                    _update_report_job(job_id, rows=len(data))
+            rows = len(data)
+            _update_report_job(job_id, rows=rows, phase='rendering')
+            with open(partial_path, 'wb') as f:
+                build_report_pdf(data, title, f)
+
+        cursor.close()
+        os.replace(partial_path, output_path)
+        _update_report_job(job_id, status='done', rows=rows, finished_at=time_module.time())
+
+    except Exception as e:
+        _update_report_job(job_id, status='failed', error=str(e), finished_at=time_module.time())
+
+    finally:
+        if conn is not None:
+            conn.close()
+
+
+def submit_report_job(owner, query, params, title, fmt):
+    """Queue a report export and return its state, or None if the queue is full."""
+    if _sweep_report_jobs() >= app.config['REPORT_JOB_MAX_PENDING']:
+        return None
+
+    job_id = uuid.uuid4().hex
+    state = _update_report_job(
+        job_id,
+        id=job_id,
+        owner=owner,
+        title=title,
+        format=fmt,
+        status='queued',
+        rows=0,
+        created_at=time_module.time()
+    )
+    _get_report_executor().submit(_run_report_job, job_id, query, params, title, fmt)
+    return state
+
+
+def _report_job_response(state):
+    state = {k: v for k, v in state.items() if k != 'owner'}
+    state['status_url'] = url_for('report_job_status', job_id=state['id'])
+    if state['status'] == 'done':
+        state['download_url'] = url_for('download_report_job', job_id=state['id'])
+    return state
+
+
+def _owned_report_job(job_id):
+    state = read_report_job(job_id)
+    if state is None or state['owner'] != session['user_id']:
+        abort(404)
+    return state
+
+
+@app.route('/admin/report_jobs', methods=['POST'])
+@role_required('admin')
+def create_report_job():
+    batch_id = request.form.get('batch_id') or session.get('report_batch_id')
+    department_id = request.form.get('department_id') or session.get('report_department_id')
+    semester_id = request.form.get('semester_id') or session.get('report_semester_id')
+    section_id = request.form.get('section_id') or session.get('report_section_id')
+    fmt = request.form.get('format', 'csv')
+
+    if fmt not in REPORT_JOB_FORMATS:
+        return jsonify({'error': 'Unsupported export format.'}), 400
+    if not (batch_id and department_id and semester_id):
+        return jsonify({'error': 'Please select Batch, Department and Semester.'}), 400
+
+    query, params = admin_report_query(batch_id, department_id, semester_id, section_id)
+    title = report_title(
+        reference_name('batches', batch_id),
+        reference_name('departments', department_id),
+        reference_name('semesters', semester_id),
+        reference_name('sections', section_id) if section_id else None
+    )
+
+    state = submit_report_job(session['user_id'], query, params, title, fmt)
+    if state is None:
+        return jsonify({'error': 'Too many exports are already running. Please try again shortly.'}), 429
+
+    return jsonify(_report_job_response(state)), 202
+
+
+@app.route('/admin/report_jobs/<job_id>')
+@role_required('admin')
+def report_job_status(job_id):
+    return jsonify(_report_job_response(_owned_report_job(job_id)))
+
+
+@app.route('/admin/report_jobs/<job_id>/download')
+@role_required('admin')
+def download_report_job(job_id):
+    state = _owned_report_job(job_id)
+    if state['status'] != 'done':
+        return jsonify(_report_job_response(state)), 409
+
+    fmt = state['format']
+    return send_file(
+        _report_job_path(job_id, fmt),
+        mimetype=REPORT_JOB_FORMATS[fmt],
+        as_attachment=True,
+        download_name=f"{slugify(state['title'])}.{fmt}"
+    )
+
+
 @app.route('/register_admin', methods=['GET', 'POST'])
 def register_admin():
-    # Check if an admin already exists
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM users WHERE role = %s', ('admin',))
-    admin_exists = cursor.fetchone()
-    conn.close()
-
-    if admin_exists:
+    # Check if an admin already exists. Either cached answer may be stale
+    # (another worker registered or removed one), so ask the database.
+    if admin_exists(refresh=True):
         flash('An admin already exists. Please log in.', 'error')
         return redirect(url_for('login'))
 
@@ -1563,6 +4257,7 @@ def register_admin():
         ''', (user_id, name, email, password, 'admin'))  # 'admin' as a string value
         conn.commit()
         conn.close()
+        invalidate_admin_exists()
         flash('Admin registered successfully! Please log in.', 'success')
         return redirect(url_for('login'))
 
@@ -1588,6 +4283,10 @@ def create_course():
         conn = get_db_connection()
         cursor = conn.cursor()
 
+        if not scope_is_live(cursor, batch_id, department_id):
+            conn.close()
+            return jsonify({'status': 'error', 'msg': 'That batch or department has been deleted.'}), 400
+
         # DUPLICATE CHECK (case-insensitive)
         if section_id:
             cursor.execute("""
@@ -1620,19 +4319,15 @@ def create_course():
 
         conn.commit()
         conn.close()
+        invalidate_dropdowns()
+        invalidate_student_overview()
 
         return jsonify({'status': 'success', 'msg': 'Course created successfully!'})
 
     # ---------- GET ----------
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT id, name FROM semesters ORDER BY id')
-    semesters = cursor.fetchall()
-    cursor.execute('SELECT id, name FROM departments ORDER BY name')
-    departments = cursor.fetchall()
-    cursor.execute('SELECT id, name FROM batches ORDER BY name')
-    batches = cursor.fetchall()
-    conn.close()
+    semesters = reference_rows('semesters', order_by='id')
+    departments = reference_rows('departments')
+    batches = reference_rows('batches')
 
     return render_template(
         'create_course.html',
@@ -1649,14 +4344,11 @@ def manage_courses():
     cursor = conn.cursor()
 
     # ---------- DROPDOWNS ----------
-    cursor.execute('SELECT id, name FROM batches ORDER BY name')
-    batches = cursor.fetchall()
+    batches = reference_rows('batches')
 
-    cursor.execute('SELECT id, name FROM departments ORDER BY name')
-    departments = cursor.fetchall()
+    departments = reference_rows('departments')
 
-    cursor.execute('SELECT id, name FROM semesters ORDER BY id')
-    semesters = cursor.fetchall()
+    semesters = reference_rows('semesters', order_by='id')
 
     courses = []
     selected_batch = selected_department = selected_semester = selected_section = None
@@ -1729,6 +4421,9 @@ def delete_course(course_id):
         cursor.execute('DELETE FROM courses WHERE id = %s', (course_id,))
         
         conn.commit()
+        invalidate_timetable()
+        invalidate_dropdowns()
+        invalidate_student_overview()
         flash('Course and all related data deleted successfully!', 'success')
         
     except Exception as e:
@@ -1751,14 +4446,11 @@ def mark_attendance():
     # -------------------------------
     # Static dropdowns
     # -------------------------------
-    cursor.execute('SELECT id, name FROM batches ORDER BY name')
-    batches = cursor.fetchall()
+    batches = reference_rows('batches')
 
-    cursor.execute('SELECT id, name FROM departments ORDER BY name')
-    departments = cursor.fetchall()
+    departments = reference_rows('departments')
 
-    cursor.execute('SELECT id, name FROM semesters ORDER BY name')
-    semesters = cursor.fetchall()
+    semesters = reference_rows('semesters')
 
     # -------------------------------
     # POST → Mark Attendance
@@ -1791,6 +4483,17 @@ def mark_attendance():
             if not cursor.fetchone():
                 return flash("Unauthorized or invalid course allocation.", "warning")
 
+            # A deleted batch/department keeps its allocations until the purge
+            # reaches them; don't add attendance the purge is removing.
+            if not scope_is_live(cursor, batch_id, department_id):
+                raise Exception("That batch or department has been deleted.")
+
+            if not batch_partition_exists(cursor, batch_id):
+                raise Exception(
+                    "Attendance storage for this batch is not set up yet. "
+                    "Ask an admin to run 'flask attendance-partitions'."
+                )
+
             # selected_date = date.fromisoformat(attendance_date)
             # if selected_date != date.today():
             #     return flash("Attendance can only be marked for today's date.", "warning")
@@ -1811,45 +4514,59 @@ def mark_attendance():
             if cursor.fetchone():
                 return flash("Attendance already marked for this class.", "warning")
 
-            # PRACTICAL BLOCK → get all slots of that day
-            practical_slots = []
-            if class_type == "Practical":
-                cursor.execute("""
-                    SELECT start_time, end_time
-                    FROM timetable
-                    WHERE batch_id=%s AND department_id=%s AND semester_id=%s
-                      AND course_id=%s
-                      AND (section_id=%s OR (%s IS NULL AND section_id IS NULL))
-                      AND TRIM(day) = TO_CHAR(%s::date, 'FMDay')
-                      AND class_type='Pr'
-                    ORDER BY start_time
-                """, (batch_id, department_id, semester_id, course_id, section_id, section_id, attendance_date))
-                practical_slots = cursor.fetchall()
-
-            # INSERT ATTENDANCE
-            for key, value in request.form.items():
-                if key.startswith('attendance_'):
-                    student_id = key.split('_')[1]
-
-                    if class_type == "Practical" and practical_slots:
-                        for st, et in practical_slots:
-                            cursor.execute("""
-                                INSERT INTO attendance
-                                (student_id, course_id, batch_id, department_id, semester_id,
-                                 section_id, date, start_time, end_time, status, class_type)
-                                VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
-                            """, (student_id, course_id, batch_id, department_id, semester_id,
-                                  section_id, attendance_date, st, et, value, "Practical"))
-                    else:
-                        cursor.execute("""
-                            INSERT INTO attendance
-                            (student_id, course_id, batch_id, department_id, semester_id,
-                             section_id, date, start_time, end_time, status, class_type)
-                            VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
-                        """, (student_id, course_id, batch_id, department_id, semester_id,
-                              section_id, attendance_date, start_time, end_time, value, class_type))
+            # INSERT ATTENDANCE → one statement for the whole class.
+            # For a practical block every student gets one row per 'Pr' slot
+            # of that day; otherwise (or when the timetable has no practical
+            # slots) one row for the submitted start/end time.
+            marks = [
+                (key.split('_', 1)[1], value)
+                for key, value in request.form.items()
+                if key.startswith('attendance_')
+            ]
+            day_name = date.fromisoformat(attendance_date).strftime("%A")
+
+            cursor.execute("""
+                WITH marks AS (
+                    SELECT *
+                    FROM UNNEST(%s::text[], %s::text[]) AS m(student_id, status)
+                ),
+                practical_slots AS (
+                    SELECT t.start_time::time AS start_time, t.end_time::time AS end_time
+                    FROM timetable t
+                    WHERE %s = 'Practical'
+                      AND t.batch_id=%s AND t.department_id=%s AND t.semester_id=%s
+                      AND t.course_id=%s
+                      AND (t.section_id=%s OR (%s IS NULL AND t.section_id IS NULL))
+                      AND t.day = %s
+                      AND t.class_type='Pr'
+                ),
+                slots AS (
+                    SELECT start_time, end_time, 'Practical'::class_kind AS class_type
+                    FROM practical_slots
+                    UNION ALL
+                    SELECT %s::time, %s::time, %s::class_kind
+                    WHERE NOT EXISTS (SELECT 1 FROM practical_slots)
+                ),
+                inserted AS (
+                    INSERT INTO attendance
+                    (student_id, course_id, batch_id, department_id, semester_id,
+                     section_id, date, start_time, end_time, status, class_type)
+                    SELECT m.student_id, %s, %s, %s, %s, %s, %s::date,
+                           s.start_time, s.end_time, m.status::attendance_status, s.class_type
+                    FROM marks m
+                    CROSS JOIN slots s
+                    RETURNING student_id, course_id, status
+                )
+            """ + SUMMARY_ADD_SQL.format(source='inserted'), (
+                [m[0] for m in marks], [m[1] for m in marks],
+                class_type, batch_id, department_id, semester_id, course_id,
+                section_id, section_id, day_name,
+                start_time, end_time, class_type,
+                course_id, batch_id, department_id, semester_id, section_id, attendance_date
+            ))
 
             conn.commit()
+            invalidate_student_overview(m[0] for m in marks)
             flash("Attendance marked successfully!", "success")
             return redirect(url_for('mark_attendance'))
 
@@ -1894,13 +4611,19 @@ def mark_attendance():
             course_id = None
 
     if course_id:
-        cursor.execute("""
+        # Separate predicates (not an OR) so the roster index applies.
+        section_filter = "AND section_id = %s" if section_id else "AND section_id IS NULL"
+        params = [batch_id, department_id]
+        if section_id:
+            params.append(section_id)
+
+        cursor.execute(f"""
             SELECT id, name FROM users
             WHERE role='student'
               AND batch_id=%s AND department_id=%s
-              AND (section_id=%s OR (%s IS NULL AND section_id IS NULL))
-            ORDER BY CAST(SUBSTRING(id FROM '(\\d+)$') AS INTEGER)
-        """, (batch_id, department_id, section_id, section_id))
+              {section_filter}
+            ORDER BY id_sort_key, id
+        """, params)
         students = cursor.fetchall()
 
     conn.close()
@@ -1920,88 +4643,75 @@ def mark_attendance():
     )
 
 
+def _schedule_scope_args():
+    """(batch, department, semester, section, course) from the query string."""
+    scope = [request.args.get(name) for name in
+             ("batch_id", "department_id", "semester_id", "section_id", "course_id")]
+    if not all(scope[:3] + scope[4:]):
+        return None
+    # Convert empty section_id → None
+    scope[3] = scope[3] if scope[3] and scope[3].strip() != "" else None
+    return scope
+
+
 @app.route('/api/timetable_lookup')
 @role_required("teacher")
 def timetable_lookup():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    try:
-        batch_id = request.args.get("batch_id")
-        department_id = request.args.get("department_id")
-        semester_id = request.args.get("semester_id")
-        course_id = request.args.get("course_id")
-        section_id = request.args.get("section_id")
-        date_str = request.args.get("date")
+    scope = _schedule_scope_args()
+    date_str = request.args.get("date")
 
-        if not all([batch_id, department_id, semester_id, course_id, date_str]):
-            return jsonify({"error": "Missing parameters"}), 400
+    if scope is None or not date_str:
+        return jsonify({"error": "Missing parameters"}), 400
 
-        # Convert empty section_id → None
-        section_id = int(section_id) if section_id and section_id.strip() != "" else None
-
-        # Convert date → weekday
-        day_name = datetime.strptime(date_str, "%Y-%m-%d").strftime("%A")
-
-        # Build query depending on section presence
-        if section_id is None:
-            cursor.execute("""
-                SELECT id, start_time, end_time, class_type
-                FROM timetable
-                WHERE batch_id=%s
-                  AND department_id=%s
-                  AND semester_id=%s
-                  AND course_id=%s
-                  AND section_id IS NULL
-                  AND day=%s
-                ORDER BY start_time
-            """, (batch_id, department_id, semester_id, course_id, day_name))
-        else:
-            cursor.execute("""
-                SELECT id, start_time, end_time, class_type
-                FROM timetable
-                WHERE batch_id=%s
-                  AND department_id=%s
-                  AND semester_id=%s
-                  AND course_id=%s
-                  AND section_id=%s
-                  AND day=%s
-                ORDER BY start_time
-            """, (batch_id, department_id, semester_id, course_id, section_id, day_name))
+    try:
+        day_name = WEEKDAY_NAMES[date.fromisoformat(date_str).weekday()]
+    except ValueError:
+        return jsonify({"error": "Invalid date"}), 400
 
-        rows = cursor.fetchall()
+    classes = scheduled_classes(*scope, day_name)
 
-        classes = [
-            {
-                "entry_id": r[0],
-                "start_time": r[1],
-                "end_time": r[2],
-                "class_type": r[3]
-            }
-            for r in rows
-        ]
+    return jsonify({
+        "day": day_name,
+        "total_classes": len(classes),
+        "classes": classes
+    })
 
-        return jsonify({
-            "day": day_name,
-            "total_classes": len(classes),
-            "classes": classes
-        })
 
-    finally:
-        conn.close()
+@app.route('/api/timetable_range')
+@role_required("teacher")
+def timetable_range():
+    """Scheduled classes of a course for every date from start to end."""
+    scope = _schedule_scope_args()
+    start_str = request.args.get("start")
+    end_str = request.args.get("end")
 
-# Add this near the top of your Flask application file
+    if scope is None or not start_str or not end_str:
+        return jsonify({"error": "Missing parameters"}), 400
 
-def convert_to_12h(time_str):
     try:
-        # Handle both 'HH:MM' and 'HH:MM:SS' formats
-        time_obj = datetime.strptime(time_str, '%H:%M') if len(time_str) <= 5 else datetime.strptime(time_str, '%H:%M:%S')
-        return time_obj.strftime('%I:%M %p')
+        start = date.fromisoformat(start_str)
+        end = date.fromisoformat(end_str)
     except ValueError:
-        return time_str
-
-# Register the filter with Jinja2
-app.jinja_env.filters['convert_to_12h'] = convert_to_12h
+        return jsonify({"error": "Invalid date"}), 400
+
+    span = (end - start).days + 1
+    if span < 1 or span > TIMETABLE_RANGE_MAX_DAYS:
+        return jsonify({"error": f"Range must cover 1 to {TIMETABLE_RANGE_MAX_DAYS} days"}), 400
+
+    days = []
+    for offset in range(span):
+        day = date.fromordinal(start.toordinal() + offset)
+        day_name = WEEKDAY_NAMES[day.weekday()]
+        classes = scheduled_classes(*scope, day_name)
+        if classes:
+            days.append({"date": day.isoformat(), "day": day_name, "classes": classes})
+
+    return jsonify({
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "total_classes": sum(len(d["classes"]) for d in days),
+        "dates": days
+    })
 
 @app.route('/admin/timetable', methods=['GET', 'POST'])
 @role_required("admin")
@@ -2025,12 +4735,9 @@ def timetable():
     try:
         cursor.execute('SELECT * FROM courses')
         courses = cursor.fetchall()
-        cursor.execute('SELECT * FROM batches')
-        batches = cursor.fetchall()
-        cursor.execute('SELECT * FROM departments')
-        departments = cursor.fetchall()
-        cursor.execute('SELECT * FROM semesters')
-        semesters = cursor.fetchall()
+        batches = reference_rows('batches', order_by='id')
+        departments = reference_rows('departments', order_by='id')
+        semesters = reference_rows('semesters', order_by='id')
 
         if request.method == 'POST':
 
@@ -2050,52 +4757,7 @@ def timetable():
                 selected_semester = semester_id
                 selected_section = section_id
 
-                section_filter = "AND t.section_id = %s" if section_id else "AND t.section_id IS NULL"
-                params = [batch_id, department_id, semester_id]
-                if section_id:
-                    params.append(section_id)
-
-                cursor.execute(f'''
-                    SELECT DISTINCT start_time, end_time 
-                    FROM timetable t
-                    WHERE t.batch_id=%s AND t.department_id=%s AND t.semester_id=%s
-                    {section_filter}
-                    ORDER BY start_time
-                ''', params)
-                time_slots = cursor.fetchall()
-
-                timetable_by_day = {d: {} for d in ['Monday','Tuesday','Wednesday','Thursday','Friday']}
-
-                cursor.execute(f'''
-                    SELECT c.name, t.day, t.start_time, t.end_time, u.name, t.class_type, t.id
-                    FROM timetable t
-                    JOIN courses c ON t.course_id = c.id
-                    LEFT JOIN course_allocations ca 
-                        ON ca.course_id=t.course_id AND ca.batch_id=t.batch_id 
-                        AND ca.department_id=t.department_id AND ca.semester_id=t.semester_id
-                    LEFT JOIN users u ON ca.teacher_id=u.id AND u.role='teacher'
-                    WHERE t.batch_id=%s AND t.department_id=%s AND t.semester_id=%s
-                    {section_filter}
-                    ORDER BY t.start_time
-                ''', params)
-
-                for e in cursor.fetchall():
-                    day = e[1]
-                    key = f"{e[2]}-{e[3]}"
-                    timetable_by_day[day][key] = {
-                        'course': e[0],
-                        'teacher': e[4],
-                        'class_type': e[5],
-                        'entry_id': e[6]
-                    }
-
-                timetable_data = []
-                for s, e in time_slots:
-                    key = f"{s}-{e}"
-                    row = {'start_time': s, 'end_time': e, 'days': {}}
-                    for d in timetable_by_day:
-                        row['days'][d] = timetable_by_day[d].get(key)
-                    timetable_data.append(row)
+                timetable_data = timetable_grid(batch_id, department_id, semester_id, section_id)
 
                     # ADD ENTRY
             # ============================
@@ -2104,7 +4766,7 @@ def timetable():
                 batch_id = request.form['batch_id']
                 department_id = request.form['department_id']
                 semester_id = request.form['semester_id']
-                day = request.form['day']
+                day = request.form['day'].strip().title()
                 start_time = request.form['start_time']
                 end_time = request.form['end_time']
                 class_type = request.form['class_type']
@@ -2120,6 +4782,10 @@ def timetable():
                     flash('End time must be greater than Start time!', 'danger')
                     return redirect(url_for('timetable'))
 
+                if not scope_is_live(cursor, batch_id, department_id):
+                    flash('That batch or department has been deleted.', 'danger')
+                    return redirect(url_for('timetable'))
+
                 cursor.execute('''
                     SELECT 1 FROM timetable
                     WHERE batch_id=%s AND department_id=%s AND semester_id=%s
@@ -2139,6 +4805,7 @@ def timetable():
                 ''', (course_id, batch_id, department_id, semester_id, section_id,
                       day, start_time, end_time, class_type))
                 conn.commit()
+                invalidate_timetable(batch_id, department_id, semester_id, section_id)
                 flash('Timetable entry added successfully!', 'success')
 
     finally:
@@ -2178,14 +4845,11 @@ def edit_timetable(timetable_id):
     cursor.execute('SELECT id, name FROM courses ORDER BY name')
     courses = cursor.fetchall()
 
-    cursor.execute('SELECT id, name FROM batches ORDER BY name')
-    batches = cursor.fetchall()
+    batches = reference_rows('batches')
 
-    cursor.execute('SELECT id, name FROM departments ORDER BY name')
-    departments = cursor.fetchall()
+    departments = reference_rows('departments')
 
-    cursor.execute('SELECT id, name FROM semesters ORDER BY name')
-    semesters = cursor.fetchall()
+    semesters = reference_rows('semesters')
 
     # ================= UPDATE =================
     if request.method == 'POST':
@@ -2199,7 +4863,7 @@ def edit_timetable(timetable_id):
         if not section_id:
             section_id = None   # ✅ critical fix
 
-        day = request.form['day']
+        day = request.form['day'].strip().title()
         start_time = request.form['start_time']
         end_time = request.form['end_time']
         class_type = request.form['class_type']
@@ -2209,6 +4873,10 @@ def edit_timetable(timetable_id):
             flash('End time must be greater than Start time!', 'danger')
             return redirect(url_for('edit_timetable', timetable_id=timetable_id))
 
+        if not scope_is_live(cursor, batch_id, department_id):
+            flash('That batch or department has been deleted.', 'danger')
+            return redirect(url_for('edit_timetable', timetable_id=timetable_id))
+
         # -------- DUPLICATE CHECK (EXCEPT ITSELF) --------
         cursor.execute('''
             SELECT 1 FROM timetable
@@ -2250,6 +4918,8 @@ def edit_timetable(timetable_id):
 
         conn.commit()
         conn.close()
+        invalidate_timetable(*entry[2:6])
+        invalidate_timetable(batch_id, department_id, semester_id, section_id)
 
         flash('Timetable entry updated successfully!', 'success')
         return redirect(url_for('timetable'))
@@ -2271,9 +4941,15 @@ def edit_timetable(timetable_id):
 def delete_timetable(timetable_id):
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('DELETE FROM timetable WHERE id = %s', (timetable_id,))
+    cursor.execute('''
+        DELETE FROM timetable WHERE id = %s
+        RETURNING batch_id, department_id, semester_id, section_id
+    ''', (timetable_id,))
+    scope = cursor.fetchone()
     conn.commit()
     conn.close()
+    if scope:
+        invalidate_timetable(*scope)
     flash('Timetable entry deleted successfully!', 'success')
     return redirect(url_for('timetable'))
 
@@ -2300,14 +4976,11 @@ def view_timetable():
     form_submitted = False
 
     try:
-        cursor.execute('SELECT id, name FROM batches ORDER BY name')
-        batches = cursor.fetchall()
+        batches = reference_rows('batches')
 
-        cursor.execute('SELECT id, name FROM departments ORDER BY name')
-        departments = cursor.fetchall()
+        departments = reference_rows('departments')
 
-        cursor.execute('SELECT id, name FROM semesters ORDER BY id')
-        semesters = cursor.fetchall()
+        semesters = reference_rows('semesters', order_by='id')
 
         # ================= STUDENT AUTO LOCK =================
         if session['role'] == 'student':
@@ -2349,79 +5022,9 @@ def view_timetable():
                 flash("Please select all required fields.", "warning")
 
             else:
-                # --------- TIME SLOTS ----------
-                if selected_section:
-                    cursor.execute('''
-                        SELECT DISTINCT start_time, end_time
-                        FROM timetable
-                        WHERE batch_id=%s AND department_id=%s
-                          AND semester_id=%s AND section_id=%s
-                        ORDER BY start_time
-                    ''', (selected_batch, selected_department, selected_semester, selected_section))
-                else:
-                    cursor.execute('''
-                        SELECT DISTINCT start_time, end_time
-                        FROM timetable
-                        WHERE batch_id=%s AND department_id=%s
-                          AND semester_id=%s AND section_id IS NULL
-                        ORDER BY start_time
-                    ''', (selected_batch, selected_department, selected_semester))
-
-                time_slots = cursor.fetchall()
-
-                timetable_by_day = {d: {} for d in ['Monday','Tuesday','Wednesday','Thursday','Friday']}
-
-                # --------- MAIN DATA ----------
-                if selected_section:
-                    cursor.execute('''
-                        SELECT c.name, t.day, t.start_time, t.end_time,
-                               u.name, t.class_type
-                        FROM timetable t
-                        JOIN courses c ON c.id=t.course_id
-                        LEFT JOIN course_allocations ca
-                          ON ca.course_id=t.course_id
-                         AND ca.batch_id=t.batch_id
-                         AND ca.department_id=t.department_id
-                         AND ca.semester_id=t.semester_id
-                        LEFT JOIN users u ON u.id=ca.teacher_id AND u.role='teacher'
-                        WHERE t.batch_id=%s AND t.department_id=%s
-                          AND t.semester_id=%s AND t.section_id=%s
-                        ORDER BY t.start_time
-                    ''', (selected_batch, selected_department, selected_semester, selected_section))
-                else:
-                    cursor.execute('''
-                        SELECT c.name, t.day, t.start_time, t.end_time,
-                               u.name, t.class_type
-                        FROM timetable t
-                        JOIN courses c ON c.id=t.course_id
-                        LEFT JOIN course_allocations ca
-                          ON ca.course_id=t.course_id
-                         AND ca.batch_id=t.batch_id
-                         AND ca.department_id=t.department_id
-                         AND ca.semester_id=t.semester_id
-                        LEFT JOIN users u ON u.id=ca.teacher_id AND u.role='teacher'
-                        WHERE t.batch_id=%s AND t.department_id=%s
-                          AND t.semester_id=%s AND t.section_id IS NULL
-                        ORDER BY t.start_time
-                    ''', (selected_batch, selected_department, selected_semester))
-
-                rows = cursor.fetchall()
-
-                for c, day, st, et, teacher, ct in rows:
-                    key = f"{st}-{et}"
-                    timetable_by_day[day][key] = {
-                        'course': c,
-                        'teacher': teacher,
-                        'class_type': ct
-                    }
-
-                for st, et in time_slots:
-                    key = f"{st}-{et}"
-                    timetable_data.append({
-                        'start_time': st,
-                        'end_time': et,
-                        'days': {d: timetable_by_day[d].get(key) for d in timetable_by_day}
-                    })
+                timetable_data = timetable_grid(
+                    selected_batch, selected_department, selected_semester, selected_section
+                )
 
     except Exception as e:
         flash(f"Timetable error: {str(e)}", "danger")
@@ -2487,11 +5090,11 @@ def view_attendance():
         ) = student
 
         # ================= SEMESTERS =================
-        cursor.execute("SELECT id, name FROM semesters ORDER BY name")
-        semesters = cursor.fetchall()
+        semesters = reference_rows('semesters')
 
         courses = []
         attendance_data = []
+        overview = []
         selected_semester = None
         selected_course = None
 
@@ -2501,80 +5104,16 @@ def view_attendance():
             selected_semester = request.form.get('semester_id')
             selected_course = request.form.get('course_id')
 
-            # ---------- COURSES (FILTERED BY SECTION IF EXISTS) ----------
+            # ---------- COURSES + ATTENDANCE (ONE CACHED QUERY) ----------
             if selected_semester:
+                overview = semester_overview(student_id, batch_id, dept_id, section_id, selected_semester)
+                courses = [(c['id'], c['name']) for c in overview]
 
-                if section_id:
-                    cursor.execute("""
-                        SELECT id, name
-                        FROM courses
-                        WHERE semester_id = %s
-                          AND batch_id = %s
-                          AND department_id = %s
-                          AND section_id = %s
-                        ORDER BY name
-                    """, (selected_semester, batch_id, dept_id, section_id))
-                else:
-                    cursor.execute("""
-                        SELECT id, name
-                        FROM courses
-                        WHERE semester_id = %s
-                          AND batch_id = %s
-                          AND department_id = %s
-                          AND section_id IS NULL
-                        ORDER BY name
-                    """, (selected_semester, batch_id, dept_id))
-
-                courses = cursor.fetchall()
-
-            # ---------- ATTENDANCE ----------
-            if selected_course and selected_semester:
-
-                if section_id:
-                    cursor.execute("""
-                        SELECT a.date, a.status, c.name, a.class_type, a.start_time, a.end_time
-                        FROM attendance a
-                        JOIN courses c ON a.course_id = c.id
-                        WHERE a.student_id = %s
-                          AND a.course_id = %s
-                          AND c.batch_id = %s
-                          AND c.department_id = %s
-                          AND c.section_id = %s
-                          AND c.semester_id = %s
-                        ORDER BY a.date DESC
-                    """, (student_id, selected_course, batch_id, dept_id, section_id, selected_semester))
-                else:
-                    cursor.execute("""
-                        SELECT a.date, a.status, c.name, a.class_type, a.start_time, a.end_time
-                        FROM attendance a
-                        JOIN courses c ON a.course_id = c.id
-                        WHERE a.student_id = %s
-                          AND a.course_id = %s
-                          AND c.batch_id = %s
-                          AND c.department_id = %s
-                          AND c.section_id IS NULL
-                          AND c.semester_id = %s
-                        ORDER BY a.date DESC
-                    """, (student_id, selected_course, batch_id, dept_id, selected_semester))
-
-                raw_data = cursor.fetchall()
-
-                for r in raw_data:
-                    def fmt(t):
-                        if not t:
-                            return ""
-                        if isinstance(t, time):
-                            return t.strftime("%I:%M %p")
-                        # if string like '13:30:00' or '13:30'
-                        try:
-                            return datetime.strptime(t[:5], "%H:%M").strftime("%I:%M %p")
-                        except:
-                            return t  # fallback (never crash)
-
-                    start = fmt(r[4])
-                    end = fmt(r[5])
-
-                    attendance_data.append((r[0], r[1], r[2], r[3], start, end))
+                if selected_course and selected_course != 'all':
+                    for course in overview:
+                        if str(course['id']) == selected_course:
+                            attendance_data = course['sessions']
+                            break
 
     finally:
         cursor.close()
@@ -2586,6 +5125,7 @@ def view_attendance():
         semesters=semesters,
         courses=courses,
         attendance_data=attendance_data,
+        overview=overview if selected_course == 'all' else [],
         selected_semester=selected_semester,
         selected_course=selected_course
     )
@@ -2604,11 +5144,13 @@ def manage_batches():
             conn = get_db_connection()
             cursor = conn.cursor()
             cursor.execute(
-                'INSERT INTO batches (name) VALUES (%s)',
+                'INSERT INTO batches (name) VALUES (%s) RETURNING id',
                 (batch_name,)
             )
+            ensure_attendance_partitions(cursor, cursor.fetchone()[0])
             conn.commit()
             conn.close()
+            invalidate_reference_data()
             flash('Batch added successfully!', 'success')
 
         # DELETE BATCH (WITH FK HANDLING)
@@ -2618,43 +5160,14 @@ def manage_batches():
             cursor = conn.cursor()
 
             try:
-                # Delete attendance linked to courses of this batch
-                cursor.execute("""
-                    DELETE FROM attendance
-                    WHERE course_id IN (
-                        SELECT id FROM courses WHERE batch_id = %s
-                    )
-                """, (batch_id,))
-
-                # Delete timetable entries linked to courses of this batch
-                cursor.execute("""
-                    DELETE FROM timetable
-                    WHERE course_id IN (
-                        SELECT id FROM courses WHERE batch_id = %s
-                    )
-                """, (batch_id,))
-
-                # Delete course allocations linked to courses of this batch
-                cursor.execute("""
-                    DELETE FROM course_allocations
-                    WHERE course_id IN (
-                        SELECT id FROM courses WHERE batch_id = %s
-                    )
-                """, (batch_id,))
-
-                # Delete courses of this batch
-                cursor.execute(
-                    'DELETE FROM courses WHERE batch_id = %s',
-                    (batch_id,)
-                )
-
-                # Finally delete the batch
-                cursor.execute(
-                    'DELETE FROM batches WHERE id = %s',
-                    (batch_id,)
-                )
+                # Hide it now; its courses and attendance are purged in
+                # the background.
+                request_purge(cursor, 'batch', batch_id)
 
                 conn.commit()
+                invalidate_reference_data()
+                invalidate_timetable()
+                start_purge_worker()
                 flash(
                     'Batch deleted successfully!',
                     'success'
@@ -2671,11 +5184,7 @@ def manage_batches():
         return redirect(url_for('manage_batches'))
 
     # FETCH BATCHES
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM batches')
-    batches = cursor.fetchall()
-    conn.close()
+    batches = reference_rows('batches', order_by='id')
 
     return render_template('manage_batches.html', batches=batches)
 
@@ -2692,6 +5201,7 @@ def manage_departments():
             cursor.execute('INSERT INTO departments (name) VALUES (%s)', (department_name,))
             conn.commit()
             conn.close()
+            invalidate_reference_data()
             flash('Department added successfully!', 'success')
         elif 'delete_department' in request.form:
             department_id = request.form['department_id']
@@ -2699,42 +5209,14 @@ def manage_departments():
             cursor = conn.cursor()
 
             try:
-                # Delete attendance linked to courses of this batch
-                cursor.execute("""
-                    DELETE FROM attendance
-                    WHERE course_id IN (
-                        SELECT id FROM courses WHERE department_id = %s
-                    )
-                """, (department_id,))
-
-                # Delete timetable entries linked to courses of this batch
-                cursor.execute("""
-                    DELETE FROM timetable
-                    WHERE course_id IN (
-                        SELECT id FROM courses WHERE department_id = %s
-                    )
-                """, (department_id,))
-
-                # Delete course allocations linked to courses of this batch
-                cursor.execute("""
-                    DELETE FROM course_allocations
-                    WHERE course_id IN (
-                        SELECT id FROM courses WHERE department_id = %s
-                    )
-                """, (department_id,))
-
-                # Delete courses of this batch
-                cursor.execute(
-                    'DELETE FROM courses WHERE department_id = %s',
-                    (department_id,))
-
-                # Finally delete the batch
-                cursor.execute(
-                    'DELETE FROM departments WHERE id = %s',
-                    (department_id,))
-                
+                # Hide it now; its courses and attendance are purged in
+                # the background.
+                request_purge(cursor, 'department', department_id)
 
                 conn.commit()
+                invalidate_reference_data()
+                invalidate_timetable()
+                start_purge_worker()
                 flash('Department deleted successfully!', 'success')
 
             except Exception as e:
@@ -2749,11 +5231,7 @@ def manage_departments():
         return redirect(url_for('manage_departments'))
 
     # Fetch all departments
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM departments')
-    departments = cursor.fetchall()
-    conn.close()
+    departments = reference_rows('departments', order_by='id')
     return render_template('manage_departments.html', departments=departments)
 
 # Manage Teachers
@@ -2783,6 +5261,8 @@ def manage_teachers():
                 )
 
                 conn.commit()
+                invalidate_timetable()
+                invalidate_dropdowns()
                 flash('Teacher deleted successfully!', 'success')
             except Exception as e:
                 conn.rollback()
@@ -2844,6 +5324,7 @@ def edit_teacher(teacher_id):
                 ''', (name, email, teacher_id))
                 
             conn.commit()
+            invalidate_timetable()
             flash('Teacher updated successfully!', 'success')
             return redirect(url_for('manage_teachers'))
         except Exception as e:
@@ -2872,6 +5353,21 @@ def edit_teacher(teacher_id):
         conn.close()
 
 
+# manage_attendance shows one page at a time, newest first. The page cursor
+# is the (date, student id, attendance id) of the last row shown.
+ATTENDANCE_PAGE_SIZE = 50
+
+
+def parse_attendance_cursor(value):
+    """'YYYY-MM-DD|student_id|attendance_id' -> (date, student_id, id), or None."""
+    try:
+        day, rest = value.split('|', 1)
+        student_id, attendance_id = rest.rsplit('|', 1)
+        return date.fromisoformat(day), student_id, int(attendance_id)
+    except (AttributeError, ValueError):
+        return None
+
+
 @app.route('/admin/manage_attendance', methods=['GET', 'POST'])
 @role_required("admin")
 def manage_attendance():
@@ -2881,16 +5377,15 @@ def manage_attendance():
     form_submitted = False
 
     try:
-        cursor.execute('SELECT id, name FROM batches ORDER BY name')
-        batches = cursor.fetchall()
+        batches = reference_rows('batches')
 
-        cursor.execute('SELECT id, name FROM departments ORDER BY name')
-        departments = cursor.fetchall()
+        departments = reference_rows('departments')
 
-        cursor.execute('SELECT id, name FROM semesters ORDER BY name')
-        semesters = cursor.fetchall()
+        semesters = reference_rows('semesters')
 
         attendance_data = []
+        next_cursor = None
+        is_first_page = True
 
         selected_batch = selected_department = selected_semester = selected_course = selected_section = ''
         search_id = search_date = ''
@@ -2906,6 +5401,8 @@ def manage_attendance():
             search_id = request.form.get('search_id', '').strip()
             search_date = request.form.get('search_date', '').strip()
 
+            after = parse_attendance_cursor(request.form.get('after'))
+
             if not (selected_batch and selected_department and selected_semester and selected_course):
                 flash("Please select all required fields.", "warning")
             else:
@@ -2920,54 +5417,53 @@ def manage_attendance():
                       AND u.department_id = %s
                       AND a.course_id = %s
                       AND c.semester_id = %s
+                      AND a.batch_id = %s
+                      AND a.semester_id = %s
                 '''
-                params = [selected_batch, selected_department, selected_course, selected_semester]
+                params = [selected_batch, selected_department, selected_course, selected_semester,
+                          selected_batch, selected_semester]
 
                 if selected_section:
                     query += ' AND u.section_id = %s'
                     params.append(selected_section)
 
                 if search_id:
-                    query += ' AND (u.id::text ILIKE %s OR u.name ILIKE %s)'
+                    query += ' AND (u.id ILIKE %s OR u.name ILIKE %s)'
                     params.extend([f'%{search_id}%', f'%{search_id}%'])
 
                 if search_date:
                     query += ' AND a.date = %s'
                     params.append(search_date)
 
-                query += ' ORDER BY a.date DESC, u.id'
+                # Seek past the last row of the previous page. a.date <= %s
+                # is what lets the index scan start at the cursor; the OR
+                # alone is only a filter.
+                if after:
+                    query += '''
+                        AND a.date <= %s
+                        AND (a.date < %s OR (a.student_id, a.id) > (%s, %s))
+                    '''
+                    params.extend([after[0], after[0], after[1], after[2]])
+
+                # One extra row tells us whether there is a next page.
+                query += ' ORDER BY a.date DESC, a.student_id, a.id LIMIT %s'
+                params.append(ATTENDANCE_PAGE_SIZE + 1)
 
                 cursor.execute(query, params)
                 results = cursor.fetchall()
 
-                def convert_time(t):
-                    if not t:
-                        return ''
-                    if isinstance(t, str):
-                        try:
-                            return datetime.strptime(t[:5], "%H:%M").strftime("%I:%M %p")
-                        except:
-                            return t
-                    return t.strftime("%I:%M %p")
-
-
-                def format_date(d):
-                    if not d:
-                        return ''
-                    if isinstance(d, str):
-                        try:
-                            return datetime.strptime(d, "%Y-%m-%d").strftime("%d-%m-%Y")
-                        except:
-                            return d
-                    return d.strftime("%d-%m-%Y")
-
+                if len(results) > ATTENDANCE_PAGE_SIZE:
+                    results = results[:ATTENDANCE_PAGE_SIZE]
+                    last = results[-1]
+                    next_cursor = f"{last[3].isoformat()}|{last[1]}|{last[0]}"
+                is_first_page = after is None
 
                 attendance_data = [
                     (
                         r[0], r[1], r[2],
                         format_date(r[3]),
-                        convert_time(r[4]),
-                        convert_time(r[5]),
+                        format_time(r[4]),
+                        format_time(r[5]),
                         r[6], r[7]
                     )
                     for r in results
@@ -2986,6 +5482,8 @@ def manage_attendance():
             selected_section=selected_section,
             search_id=search_id,
             search_date=search_date,
+            next_cursor=next_cursor,
+            is_first_page=is_first_page,
             form_submitted=form_submitted 
         )
 
@@ -3002,24 +5500,27 @@ def manage_attendance():
 @role_required("admin")
 def update_attendance(attendance_id):
     if request.method == 'POST':
-        status = request.form['status']
+        status = request.form['status'].strip().lower()
 
         conn = get_db_connection()
         cursor = conn.cursor()
-        cursor.execute('''
-            UPDATE attendance
-            SET status = %s
-            WHERE id = %s
-        ''', (status, attendance_id))
+        cursor.execute('SELECT student_id FROM attendance WHERE id = %s', (attendance_id,))
+        student_ids = [r[0] for r in cursor.fetchall()]
+        set_attendance_status(cursor, attendance_id, status)
         conn.commit()
         conn.close()
+        invalidate_student_overview(student_ids)
         flash('Attendance updated successfully!', 'success')
         return redirect(url_for('manage_attendance'))
 
     # Fetch the current attendance record
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('SELECT * FROM attendance WHERE id = %s', (attendance_id,))
+    cursor.execute('''
+        SELECT id, student_id, course_id, date, start_time, end_time, status, class_type
+        FROM attendance
+        WHERE id = %s
+    ''', (attendance_id,))
     attendance_record = cursor.fetchone()
     conn.close()
 
@@ -3030,13 +5531,16 @@ def update_attendance(attendance_id):
 def delete_attendance(attendance_id):
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('DELETE FROM attendance WHERE id = %s', (attendance_id,))
+    cursor.execute('SELECT student_id FROM attendance WHERE id = %s', (attendance_id,))
+    student_ids = [r[0] for r in cursor.fetchall()]
+    delete_attendance_rows(cursor, 'id = %s', (attendance_id,))
     conn.commit()
     conn.close()
+    invalidate_student_overview(student_ids)
     flash('Attendance deleted successfully!', 'success')
     return redirect(url_for('manage_attendance'))
  
-def generate_timetable_pdf(timetable_data, batch_name, department_name, semester_name):
+def generate_timetable_pdf(timetable_data, batch_name, department_name, semester_name, section_name=None):
     buffer = BytesIO()
     doc = SimpleDocTemplate(
         buffer, pagesize=letter,
@@ -3044,55 +5548,14 @@ def generate_timetable_pdf(timetable_data, batch_name, department_name, semester
         topMargin=0.5 * inch, bottomMargin=0.5 * inch
     )
 
-    styles = getSampleStyleSheet()
-
-    # Custom style for table content
-    table_content_style = ParagraphStyle(
-        name='TableContent',
-        parent=styles['Normal'],
-        fontSize=8,   # smaller font size
-        alignment=1,  # center alignment
-        leading=10,   # line spacing
-    )
-
-    elements = []
-
-        # ---------- Logo + University Title ----------
-    try:
-        # Add Logo (adjust width/height as needed)
-        logo = Image('static/uni_logo.png', width=1*inch, height=1*inch)
-        logo.hAlign = 'CENTER'
-        elements.append(logo)
-    except Exception as e:
-        # If logo not found, continue without it
-        pass
-
-    # University Title
-    uni_title = Paragraph(
-        "<para align='center'><b>BENAZIR BHUTTO SHAHEED UNIVERSITY OF TECHNOLOGY AND SKILL DEVELOPMENT KHAIRPUR</b></para>",
-        styles['Title']
-    )
-    elements.append(uni_title)
-    elements.append(Spacer(1, 0.2 * inch))
+    assets = pdf_assets()
+    table_content_style = assets['table_content']
 
-    # Title
-    title = Paragraph(
-        f"<para align='center'><b>Timetable for {batch_name}, {department_name}, {semester_name}</b></para>",
-        styles['Title']
+    elements = pdf_heading(
+        f"<para align='center'><b>Timetable for {batch_name}, {department_name}, {semester_name}"
+        f"{f', {section_name}' if section_name else ''}</b></para>",
+        space_after=0.3 * inch
     )
-    elements.append(title)
-    elements.append(Spacer(1, 0.3 * inch))  # Spacer below title
-
-    # Convert time to 12-hour format
-    def format_time(time_str):
-        try:
-            hour, minute = map(int, time_str.split(':'))
-            period = 'AM' if hour < 12 else 'PM'
-            hour = hour % 12
-            hour = 12 if hour == 0 else hour
-            return f"{hour}:{minute:02d} {period}"
-        except:
-            return time_str
 
     # Prepare data for table
     headers = ["Time", "Monday", "Tuesday", "Wednesday", "Thursday", "Friday"]
@@ -3159,11 +5622,51 @@ def generate_timetable_pdf(timetable_data, batch_name, department_name, semester
     buffer.seek(0)
     return buffer
 
+# Rendered timetable PDFs are kept on disk, named by a digest of everything
+# drawn on them, so a download only re-renders after the timetable changes.
+app.config['TIMETABLE_PDF_DIR'] = os.environ.get(
+    'TIMETABLE_PDF_DIR', os.path.join(tempfile.gettempdir(), 'attendance_timetable_pdfs')
+)
+# Bump when generate_timetable_pdf's layout changes.
+TIMETABLE_PDF_LAYOUT = 3
+
+
+def timetable_pdf_etag(timetable_data, names):
+    payload = json.dumps([TIMETABLE_PDF_LAYOUT, names, timetable_data], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+
+
+def cached_timetable_pdf(scope, etag, timetable_data, names):
+    """Path of the rendered PDF for this version, rendering it if needed."""
+    pdf_dir = app.config['TIMETABLE_PDF_DIR']
+    prefix = '_'.join(str(part or 0) for part in scope)
+    path = os.path.join(pdf_dir, f'{prefix}-{etag}.pdf')
+    if os.path.exists(path):
+        return path
+
+    os.makedirs(pdf_dir, exist_ok=True)
+    pdf_buffer = generate_timetable_pdf(timetable_data, *names)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(pdf_buffer.getvalue())
+    os.replace(tmp_path, path)
+
+    # Keep only the current version of each scope.
+    for name in os.listdir(pdf_dir):
+        if name.startswith(prefix + '-') and name.endswith('.pdf') and name != os.path.basename(path):
+            try:
+                os.remove(os.path.join(pdf_dir, name))
+            except FileNotFoundError:
+                pass
+    return path
+
+
 @app.route('/download_timetable_pdf')
 def download_timetable_pdf():
     batch_id = request.args.get('batch_id')
     department_id = request.args.get('department_id')
     semester_id = request.args.get('semester_id')
+    section_id = request.args.get('section_id') or None
 
     conn = get_db_connection()
     cursor = conn.cursor()
@@ -3194,78 +5697,47 @@ def download_timetable_pdf():
                     batch_id, department_id, semester_id = row
 
         # Get names safely
-        cursor.execute('SELECT name FROM batches WHERE id = %s', (batch_id,))
-        row = cursor.fetchone()
-        if not row:
+        batch_name = reference_name('batches', batch_id)
+        if batch_name is None:
             raise ValueError("Invalid batch_id")
-        batch_name = row[0]
 
-        cursor.execute('SELECT name FROM departments WHERE id = %s', (department_id,))
-        row = cursor.fetchone()
-        if not row:
+        department_name = reference_name('departments', department_id)
+        if department_name is None:
             raise ValueError("Invalid department_id")
-        department_name = row[0]
 
-        cursor.execute('SELECT name FROM semesters WHERE id = %s', (semester_id,))
-        row = cursor.fetchone()
-        if not row:
+        semester_name = reference_name('semesters', semester_id)
+        if semester_name is None:
             raise ValueError("Invalid semester_id")
-        semester_name = row[0]
-
-
-        # Get all timetable slots - FIXED: Added start_time to SELECT for ORDER BY
-        cursor.execute('''
-            SELECT DISTINCT start_time, end_time 
-            FROM timetable 
-            WHERE batch_id = %s AND department_id = %s AND semester_id = %s
-            ORDER BY start_time
-        ''', (batch_id, department_id, semester_id))
-        time_slots = cursor.fetchall()
-
-        # Organize timetable data
-        timetable_by_day = {day: {} for day in ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']}
-
-        cursor.execute('''
-            SELECT c.name, t.day, t.start_time, t.end_time, u.name, t.class_type
-            FROM timetable t
-            JOIN courses c ON t.course_id = c.id
-            LEFT JOIN course_allocations ca ON ca.course_id = t.course_id
-                AND ca.batch_id = t.batch_id
-                AND ca.department_id = t.department_id
-                AND ca.semester_id = t.semester_id
-            LEFT JOIN users u ON ca.teacher_id = u.id
-            WHERE t.batch_id = %s AND t.department_id = %s AND t.semester_id = %s
-            ORDER BY t.start_time
-        ''', (batch_id, department_id, semester_id))
-
-        for course_name, day, start_time, end_time, teacher_name, class_type in cursor.fetchall():
-            time_key = f"{start_time}-{end_time}"
-            timetable_by_day[day][time_key] = {
-                'course': course_name,
-                'teacher': teacher_name,
-                'class_type': class_type
-            }
-
-        # Build timetable data
-        timetable_data = []
-        for start_time, end_time in time_slots:
-            time_key = f"{start_time}-{end_time}"
-            row = {
-                'start_time': start_time,
-                'end_time': end_time,
-                'days': {}
-            }
-            for day in ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']:
-                row['days'][day] = timetable_by_day[day].get(time_key, None)
-            timetable_data.append(row)
 
-        # Generate and send PDF
-        pdf_buffer = generate_timetable_pdf(timetable_data, batch_name, department_name, semester_name)
+        if section_id:
+            section_name = reference_name('sections', section_id)
+            if section_name is None:
+                raise ValueError("Invalid section_id")
+            section_name = f"Section {section_name}"
+        else:
+            # No section chosen: one PDF covering every section.
+            section_id = TIMETABLE_ALL_SECTIONS
+            section_name = "All Sections"
+
+        timetable_data = timetable_grid(batch_id, department_id, semester_id, section_id)
+        names = (batch_name, department_name, semester_name, section_name)
+        etag = timetable_pdf_etag(timetable_data, names)
+
+        # The browser already has this exact version.
+        if request.if_none_match.contains(etag):
+            response = make_response('', 304)
+            response.set_etag(etag)
+            return response
+
+        scope = _timetable_key(batch_id, department_id, semester_id, section_id)
+        pdf_path = cached_timetable_pdf(scope, etag, timetable_data, names)
         return send_file(
-            pdf_buffer,
+            pdf_path,
             as_attachment=True,
-            download_name=f"Timetable_{batch_name}_{department_name}_{semester_name}.pdf",
-            mimetype='application/pdf'
+            download_name=f"Timetable_{batch_name}_{department_name}_{semester_name}_{section_name}.pdf",
+            mimetype='application/pdf',
+            etag=etag,
+            conditional=True
         )
         
     except Exception as e:
@@ -3275,18 +5747,6 @@ def download_timetable_pdf():
     finally:
         conn.close()
 
-@app.template_filter('convert_to_12h')
-def convert_to_12h(time_str):
-    try:
-        hour, minute = map(int, time_str.split(':'))
-        period = 'AM' if hour < 12 else 'PM'
-        hour = hour % 12
-        hour = 12 if hour == 0 else hour
-        return f"{hour}:{minute:02d} {period}"
-    except:
-        return time_str
-
-
 if __name__ == '__main__':
     #init_db()
     #app.run(debug=True)
@@ -0,0 +1,34 @@
+// Cascading dropdown data for the current user, fetched once per page from
+// /api/dropdown_tree. The browser keeps it and revalidates with its ETag.
+const DropdownTree = (() => {
+  let tree = null;
+
+  function load() {
+    if (!tree) {
+      tree = fetch('/api/dropdown_tree', { credentials: 'same-origin' })
+        .then(r => {
+          if (!r.ok) throw new Error('Could not load dropdown data');
+          return r.json();
+        })
+        .catch(err => {
+          tree = null;   // retry on the next call
+          throw err;
+        });
+    }
+    return tree;
+  }
+
+  return {
+    load,
+
+    // [[id, name], ...], same shape as /admin/check_sections
+    sections(batchId, departmentId) {
+      return load().then(t => t.sections[`${batchId}-${departmentId}`] || []);
+    },
+
+    // [{id, name}, ...], same shape as /get_courses
+    courses(batchId, departmentId, semesterId, sectionId) {
+      return load().then(t => t.courses[`${batchId}-${departmentId}-${semesterId}-${sectionId || ''}`] || []);
+    }
+  };
+})();